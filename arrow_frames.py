@@ -0,0 +1,58 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Low-cardinality labels, stored as dictionaries / categoricals
+CATEGORY_COLUMNS = ('board', 'channel', 'message_direction')
+
+# Per-lead counters; a lead without messages has zero of each
+COUNTER_COLUMNS = ('message_count', 'ocr_count', 'audio_count', 'email_count')
+
+# Large free-text columns, kept in Arrow memory instead of Python objects
+TEXT_COLUMNS = ('message_text', 'ocr_scan', 'audio_transcription')
+
+
+def compact_batch(batch):
+    """Shrink an Arrow record batch or table to the compact column types."""
+    columns = []
+    for name, column in zip(batch.schema.names, batch.columns):
+        if name in COUNTER_COLUMNS and pa.types.is_integer(column.type):
+            column = pc.fill_null(column, 0).cast(pa.int32())
+        elif name in CATEGORY_COLUMNS and pa.types.is_string(column.type):
+            column = pc.dictionary_encode(column)
+        elif pa.types.is_timestamp(column.type) and column.type.tz is not None:
+            column = column.cast(pa.timestamp(column.type.unit, tz='UTC'))
+        columns.append(column)
+    if isinstance(batch, pa.Table):
+        return pa.Table.from_arrays(columns, names=batch.schema.names)
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+
+def table_to_frame(table):
+    """Convert a compacted Arrow table to pandas.
+
+    Text columns are wrapped as Arrow-backed strings without copying; the
+    other columns go through the regular conversion, where dictionaries
+    become categoricals.
+    """
+    text = [name for name in table.schema.names
+            if name in TEXT_COLUMNS and pa.types.is_string(table.schema.field(name).type)]
+    frame = table.drop_columns(text).to_pandas(split_blocks=True)
+    for name in text:
+        frame[name] = pd.Series(pd.arrays.ArrowExtensionArray(table[name]), index=frame.index)
+    return frame[table.schema.names]
+
+
+def compact_frame(df):
+    """Apply the compact column types to an existing DataFrame, in place.
+
+    Used after pandas operations (concat, assignment) that fall back to
+    generic dtypes.
+    """
+    for name in CATEGORY_COLUMNS:
+        if name in df.columns and not isinstance(df[name].dtype, pd.CategoricalDtype):
+            df[name] = df[name].astype('category')
+    for name in COUNTER_COLUMNS:
+        if name in df.columns and df[name].dtype != 'int32':
+            df[name] = df[name].fillna(0).astype('int32')
+    return df
@@ -0,0 +1,74 @@
+"""Time reruns of the app on the local DuckDB backend.
+
+    python -m benchmarks.fixtures fixtures/
+    python -m benchmarks.bench_app fixtures/ --runs 20
+
+Runs main.py headless with streamlit's AppTest, so the numbers are the
+Python-side cost of a rerun, free of BigQuery and network latency. It
+reports the first run (cold, includes loading), the median warm rerun of
+the lead list, the median time to open a lead, and how many elements each
+one renders with their serialized size, which is what a rerun sends to the
+browser.
+"""
+import argparse
+import os
+import statistics
+import time
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+
+def _element_count(at):
+    return sum(1 for _ in at.main)
+
+
+def _payload_kb(at):
+    return sum(element.proto.ByteSize() for element in at.main
+               if getattr(element, 'proto', None) is not None) / 1024
+
+
+def _timed_runs(at, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        at.run()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('fixtures')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    os.environ['ROSENBAUM_BACKEND'] = 'duckdb'
+    os.environ['ROSENBAUM_FIXTURES_DIR'] = os.path.abspath(args.fixtures)
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    start = time.perf_counter()
+    at.run()
+    print(f"primeira execução     {time.perf_counter() - start:8.3f} s")
+    if at.exception:
+        raise SystemExit(at.exception[0].message)
+
+    rerun = _timed_runs(at, args.runs)
+    print(f"lista de leads        {rerun * 1000:8.1f} ms  {_element_count(at)} elementos  {_payload_kb(at):8.1f} KB")
+
+    # Opening a lead is timed on a fresh session each time: AppTest cannot
+    # rerun the lead page once it holds st.chat_input. Cached resources are
+    # process-wide, so only the first session pays for loading them.
+    timings = []
+    for _ in range(args.runs):
+        at = AppTest.from_file(APP_PATH, default_timeout=120)
+        at.run()
+        # AppTest cannot click a table row: select the first one through its state
+        at.session_state['lead_table'] = {'selection': {'rows': [0], 'columns': []}}
+        start = time.perf_counter()
+        at.run()
+        timings.append(time.perf_counter() - start)
+    print(f"abrir lead            {statistics.median(timings) * 1000:8.1f} ms  {_element_count(at)} elementos  {_payload_kb(at):8.1f} KB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Compare lead message lookups on raw strings against normalized keys.
+
+    python -m benchmarks.bench_contact_keys             # BigQuery: bytes and latency
+    python -m benchmarks.bench_contact_keys --local fixtures/
+
+First reports how many leads match a different number of messages once
+phones and emails are normalized. Then opens the first page of history of
+`--leads` leads with lead_messages_legacy.sql (`chat_phone = @phone OR
+account_email = @email`) and with lead_messages.sql (point lookups on
+`messages_by_lead`, plus the messages newer than its watermark). On BigQuery the query cache is disabled and the bytes
+processed are summed; locally only latency is reported.
+"""
+import argparse
+import time
+
+from contact_keys import lead_keys
+from lead_stats_job import settled_watermark, update_lead_message_stats
+from message_cache import FIRST_PAGE_CURSOR
+from query_backend import BigQueryBackend, DuckDBBackend, read_query
+
+QUERIES = ('lead_messages_legacy.sql', 'lead_messages.sql')
+PAGE_SIZE = 200
+
+
+def _params(phone, email):
+    before_created_at, before_uid = FIRST_PAGE_CURSOR
+    return {
+        'phone': phone or "",
+        'email': email or "",
+        'before_created_at': before_created_at,
+        'before_uid': before_uid,
+        'page_size': PAGE_SIZE,
+    }
+
+
+def _lookups(leads, name, settled_until):
+    """Query parameters of each lead, raw for the legacy query."""
+    for phone, email in leads:
+        if name == 'lead_messages_legacy.sql':
+            yield _params(phone, email)
+        else:
+            yield dict(_params(*lead_keys(phone, email)), settled_until=settled_until)
+
+
+def print_report(backend):
+    report = backend.run_query(read_query('contact_keys_report.sql')).iloc[0]
+    print(f"{report['leads']} leads: {report['leads_gained']} com mais mensagens, "
+          f"{report['leads_lost']} com menos, {report['leads_found']} antes sem nenhuma")
+    print(f"mensagens encontradas: {report['raw_messages']} -> {report['normalized_messages']}")
+
+
+def bench_bigquery(leads, settled_until):
+    import bigquery
+
+    client = bigquery.get_client()
+    for name in QUERIES:
+        sql = read_query(name)
+        processed, elapsed = 0, 0.0
+        for params in _lookups(leads, name, settled_until):
+            config = bigquery.query_config(params)
+            config.use_query_cache = False
+            start = time.perf_counter()
+            job = client.query(sql, job_config=config)
+            job.result()
+            elapsed += time.perf_counter() - start
+            processed += job.total_bytes_processed or 0
+        print(f"{name:28} {processed / len(leads) / 1e6:10.1f} MB/lead  {elapsed / len(leads):8.3f} s/lead")
+
+
+def bench_local(backend, leads, settled_until):
+    for name in QUERIES:
+        sql = read_query(name)
+        rows = 0
+        start = time.perf_counter()
+        for params in _lookups(leads, name, settled_until):
+            rows += len(backend.run_query(sql, params))
+        elapsed = time.perf_counter() - start
+        print(f"{name:28} {elapsed / len(leads) * 1000:8.1f} ms/lead  {rows} mensagens")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--local', metavar='FIXTURES', help='run on DuckDB over Parquet fixtures')
+    parser.add_argument('--leads', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.local:
+        backend = DuckDBBackend(fixtures_dir=args.local)
+        update_lead_message_stats(backend)
+    else:
+        backend = BigQueryBackend()
+    print_report(backend)
+
+    lead_list = backend.run_query(read_query('monday_sessions.sql')).head(args.leads)
+    leads = [(row['phone'], row['email']) for _, row in lead_list.iterrows()]
+    settled_until = settled_watermark(backend.run_query)
+    if args.local:
+        bench_local(backend, leads, settled_until)
+    else:
+        bench_bigquery(leads, settled_until)
+
+
+if __name__ == '__main__':
+    main()
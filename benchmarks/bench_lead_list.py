@@ -0,0 +1,78 @@
+"""Compare the in-memory and server-side modes of the lead list.
+
+    python -m benchmarks.bench_lead_list fixtures/
+    python -m benchmarks.bench_lead_list fixtures/ --runs 20
+
+Memory mode loads the whole list and builds its LeadIndex once, then
+filters and pages it in the process; server mode (lead_query.py) runs one
+query per page. Reports the one-off load cost and memory of memory mode,
+then the median time of a few list views in each mode. Runs on DuckDB over
+Parquet fixtures, so server mode is measured without network latency.
+"""
+import argparse
+import statistics
+import time
+from datetime import timedelta
+
+from lead_index import LeadIndex
+from lead_query import LeadQuery
+from lead_stats_job import update_lead_message_stats
+from lead_store import prepare_leads
+from query_backend import DuckDBBackend, read_query
+
+PAGE_SIZE = 100
+
+
+def _views(summary):
+    """(name, select() arguments) of the list views to time."""
+    created_end = summary['created_range'][1].date()
+    return [
+        ('primeira página', dict(start=0, stop=PAGE_SIZE)),
+        ('décima página', dict(start=9 * PAGE_SIZE, stop=10 * PAGE_SIZE)),
+        ('quadro + OCR', dict(start=0, stop=PAGE_SIZE, board=summary['boards'][0], has_ocr=True)),
+        ('últimos 30 dias', dict(start=0, stop=PAGE_SIZE,
+                                 created=(created_end - timedelta(days=30), created_end))),
+        ('busca por título', dict(start=0, stop=PAGE_SIZE, title='joao')),
+        ('mais mensagens', dict(start=0, stop=PAGE_SIZE, sort='message_count')),
+    ]
+
+
+def _median_ms(select, arguments, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        select(**arguments)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('fixtures')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    backend = DuckDBBackend(fixtures_dir=args.fixtures)
+    update_lead_message_stats(backend)
+
+    start = time.perf_counter()
+    frame = prepare_leads(backend.run_query(read_query('monday_sessions.sql')))
+    index = LeadIndex(frame)
+    summary = index.summary()
+    loaded = time.perf_counter() - start
+    size = frame.memory_usage(deep=True).sum() / 1e6
+    print(f"memória: carga {loaded:.3f} s, {len(frame)} leads, {size:.1f} MB por processo")
+
+    query = LeadQuery(backend.run_query)
+    print(f"{'':20} {'memória':>10} {'servidor':>10}")
+    for name, arguments in _views(summary):
+        memory_ms = _median_ms(index.select, arguments, args.runs)
+        server_ms = _median_ms(query.select, arguments, args.runs)
+        print(f"{name:20} {memory_ms:8.1f} ms {server_ms:8.1f} ms")
+    memory_ms = _median_ms(lambda: index.summary(), {}, args.runs)
+    server_ms = _median_ms(lambda: query.summary(), {}, args.runs)
+    print(f"{'resumo':20} {memory_ms:8.1f} ms {server_ms:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
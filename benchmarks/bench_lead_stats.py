@@ -0,0 +1,64 @@
+"""Compare the lead list query on the rollup against the legacy CTE query.
+
+    python -m benchmarks.bench_lead_stats             # BigQuery: bytes and latency
+    python -m benchmarks.bench_lead_stats --local fixtures/
+
+On BigQuery each query is dry-run for bytes processed, then run with the
+query cache disabled. Locally, the rollup is built from the fixtures first
+and only latency is reported.
+"""
+import argparse
+import statistics
+import time
+
+from lead_stats_job import update_lead_message_stats
+from query_backend import DuckDBBackend, read_query
+
+QUERIES = ('monday_sessions_legacy.sql', 'monday_sessions.sql')
+
+
+def _timed(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = run()
+        timings.append(time.perf_counter() - start)
+    return rows, statistics.median(timings)
+
+
+def bench_bigquery(repeat):
+    from google.cloud import bigquery as bq
+    from bigquery import get_client
+
+    client = get_client()
+
+    for name in QUERIES:
+        sql = read_query(name)
+        dry = client.query(sql, job_config=bq.QueryJobConfig(dry_run=True, use_query_cache=False))
+        config = bq.QueryJobConfig(use_query_cache=False)
+        rows, latency = _timed(lambda: client.query(sql, job_config=config).result().total_rows, repeat)
+        print(f"{name:32} {dry.total_bytes_processed / 1e9:10.3f} GB  {latency:8.3f} s  {rows} linhas")
+
+
+def bench_local(fixtures_dir, repeat):
+    backend = DuckDBBackend(fixtures_dir=fixtures_dir)
+    update_lead_message_stats(backend)
+    for name in QUERIES:
+        sql = read_query(name)
+        rows, latency = _timed(lambda: len(backend.run_query(sql)), repeat)
+        print(f"{name:32} {latency:8.3f} s  {rows} linhas")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--local', metavar='FIXTURES', help='run on DuckDB over Parquet fixtures')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    if args.local:
+        bench_local(args.local, args.repeat)
+    else:
+        bench_bigquery(args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Generate synthetic Parquet fixtures for running the queries locally.
+
+    python -m benchmarks.fixtures fixtures/ --leads 20000 --messages 1000000
+
+Writes `<dir>/dbt/monday_sessions.parquet` and `<dir>/gtms/messages.parquet`
+with the columns the query files use. Like the real data, some phones and
+emails are spelled differently in Monday and in the messages.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+BOARDS = ['Leads', 'Previdenciário', 'Trabalhista', 'Cível', 'Consumidor']
+NAMES = ['João', 'Maria', 'José', 'Ana', 'Antônio', 'Francisca', 'Conceição', 'Sebastião']
+
+
+def make_fixtures(leads, messages, seed=0):
+    """Return (monday_sessions, messages) DataFrames."""
+    rng = np.random.default_rng(seed)
+    now = pd.Timestamp.now(tz='UTC').floor('s')
+
+    ids = np.arange(1_000_000, 1_000_000 + leads)
+    phones = np.array([f"55119{n:08d}" for n in rng.integers(6 * 10**7, 10**8, leads)])
+    has_email = rng.random(leads) < 0.3
+    emails = np.where(has_email, [f"lead{n}@example.com" for n in ids], None)
+    # Monday spellings: "+55 (11) 98765-4321", " Lead1@Example.com"
+    formatted = rng.random(leads) < 0.2
+    monday_phones = np.where(
+        formatted, [f"+{p[:2]} ({p[2:4]}) {p[4:9]}-{p[9:]}" for p in phones], phones)
+    monday_emails = np.where(
+        formatted & has_email, [f" {str(e).capitalize()}" for e in emails], emails)
+    sessions = pd.DataFrame({
+        'id': ids,
+        # Not a TIMESTAMP column: the queries cast it, and must keep doing so
+        'created_at': (now - pd.to_timedelta(rng.integers(0, 365 * 86400, leads), unit='s'))
+            .strftime('%Y-%m-%d %H:%M:%S'),
+        'board': rng.choice(BOARDS, leads),
+        'title': [f"{rng.choice(NAMES)} - Processo {n}" for n in ids],
+        'phone': monday_phones,
+        'email': monday_emails,
+        'monday_link': [f"https://rosenbaum.monday.com/boards/1/pulses/{n}" for n in ids],
+    })
+
+    owner = rng.integers(0, leads, messages)
+    is_email = rng.random(messages) < 0.05
+    has_ocr = rng.random(messages) < 0.08
+    has_audio = rng.random(messages) < 0.1
+    # Older WhatsApp messages without the mobile 9th digit
+    message_phones = np.where(
+        rng.random(messages) < 0.1,
+        [p[:4] + p[5:] for p in phones[owner]], phones[owner])
+    texts = np.array(['Olá, tudo bem?', 'Segue o documento.', 'Qual o andamento do processo?',
+                      'Enviei a carta do INSS.', 'Obrigado!'])
+    messages_df = pd.DataFrame({
+        'message_uid': [f"msg_{n}" for n in range(messages)],
+        'created_at': now - pd.to_timedelta(rng.integers(0, 365 * 86400, messages), unit='s'),
+        'chat_phone': np.where(is_email, None, message_phones),
+        'account_email': np.where(is_email, emails[owner], None),
+        'channel': np.where(is_email, 'email', 'whatsapp'),
+        'message_text': rng.choice(texts, messages),
+        'message_direction': rng.choice(['received', 'sent'], messages),
+        'file_url': np.where(has_ocr, [f"https://files.example.com/{n}.pdf" for n in range(messages)], None),
+        'attachment_filename': np.where(has_ocr, 'documento.pdf', None),
+        'ocr_scan': np.where(has_ocr, 'INSTITUTO NACIONAL DO SEGURO SOCIAL ' * 40, None),
+        'audio_transcription': np.where(has_audio, 'Bom dia, estou ligando sobre o meu processo. ' * 5, None),
+    })
+    return sessions, messages_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory')
+    parser.add_argument('--leads', type=int, default=20_000)
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    sessions, messages_df = make_fixtures(args.leads, args.messages, args.seed)
+    for dataset, table, df in (('dbt', 'monday_sessions', sessions), ('gtms', 'messages', messages_df)):
+        os.makedirs(os.path.join(args.directory, dataset), exist_ok=True)
+        df.to_parquet(os.path.join(args.directory, dataset, f"{table}.parquet"), index=False)
+    print(f"{len(sessions)} leads e {len(messages_df)} mensagens em {args.directory}")
+
+
+if __name__ == '__main__':
+    main()
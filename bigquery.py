@@ -1,21 +1,137 @@
 import streamlit as st
+from datetime import datetime
 from google.oauth2 import service_account
 from google.cloud import bigquery
 import pandas as pd
+import pyarrow as pa
 
+from arrow_frames import compact_batch, table_to_frame
 
-credentials = service_account.Credentials.from_service_account_info(
-    st.secrets["gcp_service_account"]
-)
-client = bigquery.Client(credentials=credentials)
+try:
+    from google.cloud import bigquery_storage
+except ImportError:  # the Storage Read API client is optional
+    bigquery_storage = None
+
+# Rows per page when results are read through the REST API
+PAGE_SIZE = 50_000
+
+
+_client = None
+_storage_client = None
+
+def _credentials():
+    return service_account.Credentials.from_service_account_info(
+        st.secrets["gcp_service_account"]
+    )
+
+def get_client():
+    """Return the shared BigQuery client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = bigquery.Client(credentials=_credentials(), project="zapy-306602")
+    return _client
+
+def get_storage_client():
+    """Return a shared BigQuery Storage Read client, or None if unavailable."""
+    global _storage_client
+    if bigquery_storage is None:
+        return None
+    if _storage_client is None:
+        _storage_client = bigquery_storage.BigQueryReadClient(credentials=_credentials())
+    return _storage_client
+
+# Arrow types of the BigQuery column types, for results without rows
+_ARROW_TYPES = {
+    'STRING': pa.string(),
+    'BYTES': pa.binary(),
+    'INTEGER': pa.int64(),
+    'INT64': pa.int64(),
+    'FLOAT': pa.float64(),
+    'FLOAT64': pa.float64(),
+    'NUMERIC': pa.decimal128(38, 9),
+    'BIGNUMERIC': pa.decimal256(76, 38),
+    'BOOLEAN': pa.bool_(),
+    'BOOL': pa.bool_(),
+    'TIMESTAMP': pa.timestamp('us', tz='UTC'),
+    'DATETIME': pa.timestamp('us'),
+    'DATE': pa.date32(),
+    'TIME': pa.time64('us'),
+    'GEOGRAPHY': pa.string(),
+    'JSON': pa.string(),
+}
+
+def _arrow_field(field):
+    """Arrow field of a BigQuery SchemaField (nested and repeated ones included)."""
+    if field.field_type in ('RECORD', 'STRUCT'):
+        arrow_type = pa.struct([_arrow_field(sub) for sub in field.fields])
+    else:
+        arrow_type = _ARROW_TYPES.get(field.field_type, pa.string())
+    if field.mode == 'REPEATED':
+        arrow_type = pa.list_(arrow_type)
+    return pa.field(field.name, arrow_type)
+
+def empty_table(schema):
+    """Arrow table with no rows and the columns of a BigQuery result schema."""
+    return pa.schema([_arrow_field(field) for field in schema]).empty_table()
+
+def fetch_arrow(query, job_config=None):
+    """Run a query and return its result as a compacted Arrow table.
+
+    Result pages are streamed as record batches and compacted one at a time,
+    so the uncompacted result is never held in memory as a whole. Large
+    results are read through the Storage Read API when it is installed.
+    """
+    rows = get_client().query(query, job_config=job_config).result(page_size=PAGE_SIZE)
+    batches = [
+        compact_batch(batch)
+        for batch in rows.to_arrow_iterable(bqstorage_client=get_storage_client())
+    ]
+    if not batches:
+        # Typed like a non-empty result, so concatenations and merges keep their dtypes
+        return compact_batch(empty_table(rows.schema))
+    return pa.Table.from_batches(batches)
+
+def fetch_dataframe(query, job_config=None):
+    """Run a query and return its result as a DataFrame with compact dtypes."""
+    return table_to_frame(fetch_arrow(query, job_config))
+
+def _parameter_type(value):
+    if isinstance(value, datetime):
+        return "TIMESTAMP"
+    if isinstance(value, bool):
+        return "BOOL"
+    if isinstance(value, int):
+        return "INT64"
+    return "STRING"
+
+def _query_parameter(name, value):
+    """Build a BigQuery parameter, inferring its type from the value.
+
+    Lists and tuples become array parameters typed after their first item.
+    """
+    if isinstance(value, (list, tuple)):
+        item_type = _parameter_type(value[0]) if value else "STRING"
+        return bigquery.ArrayQueryParameter(name, item_type, list(value))
+    return bigquery.ScalarQueryParameter(name, _parameter_type(value), value)
+
+def query_config(params=None):
+    """Build a job config carrying the given named parameters."""
+    return bigquery.QueryJobConfig(
+        query_parameters=[_query_parameter(name, value) for name, value in (params or {}).items()]
+    )
+
+def run_query(query, params=None):
+    """Run a query with named parameters and return the result as a DataFrame."""
+    return fetch_dataframe(query, query_config(params))
+
+def run_script(script, params=None):
+    """Run a multi-statement script (DDL/DML) and wait for it to finish."""
+    get_client().query(script, job_config=query_config(params)).result()
 
 @st.cache_data(ttl=3600)
 def execute_query(query):
     try:
-        query_job = client.query(query)
-        rows_raw = query_job.result()
-        rows = [dict(row) for row in rows_raw]
-        return pd.DataFrame(rows)
+        return fetch_dataframe(query)
     except Exception as e:
         print(f"Erro ao executar query: {str(e)}")
         return pd.DataFrame()
@@ -35,4 +151,3 @@ def load_messages():
     SELECT * FROM `zapy-306602.gtms.messages_monday`
     """
     return execute_query(query)
-
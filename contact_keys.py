@@ -0,0 +1,59 @@
+"""Normalized phone and email keys of a lead.
+
+Messages and leads are matched on these keys instead of the raw strings
+Monday and the WhatsApp integration store, which differ in formatting
+(`+55`, spaces, dashes, a missing 9th digit). The same rules are defined in
+SQL by `queries/contact_keys_setup.sql`; keep both in sync.
+"""
+import re
+
+import pandas as pd
+
+_NON_DIGITS = re.compile(r'[^0-9]')
+
+
+def _missing(value):
+    return value is None or (not isinstance(value, str) and pd.isna(value))
+
+
+def normalize_phone(raw):
+    """Return a phone number in E.164 (`+5511987654321`), or None.
+
+    Numbers with 10 or 11 digits are national and get the Brazilian country
+    code. Brazilian mobile numbers still stored with 8 digits (starting with
+    6-9) get their 9th digit back.
+    """
+    if _missing(raw):
+        return None
+    digits = _NON_DIGITS.sub('', str(raw)).lstrip('0')
+    if not digits:
+        return None
+    if len(digits) in (10, 11):
+        digits = '55' + digits
+    if len(digits) == 12 and digits.startswith('55') and digits[4] in '6789':
+        digits = digits[:4] + '9' + digits[4:]
+    return '+' + digits
+
+
+def normalize_email(raw):
+    """Return a lower-cased, trimmed email, or None."""
+    if _missing(raw):
+        return None
+    return str(raw).strip().lower() or None
+
+
+def lead_keys(phone, email):
+    """Normalized (phone, email) pair a lead's messages are looked up with."""
+    return normalize_phone(phone), normalize_email(email)
+
+
+def contact_positions(leads):
+    """Positions of the rows of a lead frame by normalized phone and by normalized email."""
+    phones, emails = {}, {}
+    for position, (phone, email) in enumerate(zip(leads['phone'], leads['email'])):
+        phone_key, email_key = lead_keys(phone, email)
+        if phone_key:
+            phones.setdefault(phone_key, []).append(position)
+        if email_key:
+            emails.setdefault(email_key, []).append(position)
+    return phones, emails
@@ -0,0 +1,290 @@
+"""Conversation text for the Grok prompts, bounded by a token budget.
+
+A lead's history can hold hundreds of messages, full OCR scans and long
+audio transcriptions. Sent whole, big cases make prompts slow, expensive or
+larger than the model's context. build_conversation() renders the history
+within a per-feature budget instead:
+
+- the newest messages are kept verbatim, back to where the budget runs out;
+  the older ones are replaced by one line with their count, dates and the
+  names of their attachments;
+- OCR scans, transcriptions and very long texts are cut to a fixed size;
+- repeated content (the same scan sent twice, a template message pasted
+  again, the same link in two columns) is written once.
+
+OCR scans and transcriptions are the bulk of a history and are stored
+apart from it. Given a `load_payloads` callback, build_conversation() picks
+the messages that fit from the light columns (has_ocr / ocr_size,
+has_audio / audio_size) first, and loads the texts of those messages only.
+
+Token counts are estimates (UTF-8 bytes / 4), cheap enough to run on every
+message, and a bit high for Portuguese text, which keeps the bound safe.
+"""
+import pandas as pd
+
+# Tokens the conversation may take in the prompt of each feature
+FEATURE_BUDGETS = {
+    'summary': 24_000,
+    'suggestion': 8_000,
+    'documents': 24_000,
+    'chat': 8_000,
+}
+DEFAULT_BUDGET = 16_000
+
+# Tokens the Monday updates may take in the summary prompt, and each of them
+UPDATES_BUDGET = 3_000
+UPDATE_MAX_TOKENS = 500
+
+# Tokens the previous summary may take in an incremental summary prompt
+PREVIOUS_SUMMARY_MAX_TOKENS = 3_000
+
+# Largest size of one block of a message, in tokens
+TEXT_MAX_TOKENS = 1_500
+OCR_MAX_TOKENS = 500
+TRANSCRIPTION_MAX_TOKENS = 1_000
+
+# Texts this long repeated verbatim are templates or pastes, written once
+DUPLICATE_MIN_TOKENS = 30
+
+# Label and cut note of a truncated OCR or transcription block, in tokens
+BLOCK_OVERHEAD_TOKENS = 20
+
+# Kept free for the line describing the omitted messages
+OMITTED_NOTE_TOKENS = 600
+OMITTED_FILES_MAX = 40
+
+SECTIONS = ('mensagens', 'anexos', 'ocr', 'transcricoes', 'omitidas')
+
+_LABELS = {
+    False: {'attachment': '[Anexo: {name}]({url})', 'ocr': 'OCR: ', 'transcription': 'Transcrição: '},
+    True: {'attachment': '📎 [Anexo: {name}]({url})', 'ocr': '🔍 OCR: ', 'transcription': '🎤 Transcrição: '},
+}
+
+
+def estimate_tokens(text):
+    """Rough token count of `text`: about 4 bytes of UTF-8 per token."""
+    return (len(text.encode('utf-8')) + 3) // 4
+
+
+def truncate(text, max_tokens, label='texto'):
+    """`text` cut to about `max_tokens`, at a word boundary, with a note of the cut."""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    cut = text[:max_tokens * 4]
+    while estimate_tokens(cut) > max_tokens:
+        cut = cut[:int(len(cut) * 0.9)]
+    cut = cut.rsplit(None, 1)[0] if ' ' in cut else cut
+    return f"{cut} … [{label} cortado: ~{tokens - estimate_tokens(cut)} tokens omitidos]"
+
+
+def fit_lines(lines, budget):
+    """The first of `lines` that fit in `budget` tokens, and how many were left out."""
+    kept, used = [], 0
+    for line in lines:
+        tokens = estimate_tokens(line) + 1
+        if used + tokens > budget:
+            break
+        kept.append(line)
+        used += tokens
+    return kept, len(lines) - len(kept)
+
+
+def _present(value):
+    return not (value is None or (pd.api.types.is_scalar(value) and pd.isna(value)))
+
+
+class ConversationContext:
+    """Rendered conversation and how many tokens each of its sections took."""
+
+    def __init__(self, text, usage, kept, total, budget, duplicates, truncated):
+        self.text = text
+        self.usage = usage
+        self.kept = kept
+        self.total = total
+        self.budget = budget
+        self.duplicates = duplicates
+        self.truncated = truncated
+
+    @property
+    def tokens(self):
+        return sum(self.usage.values())
+
+    def describe(self):
+        """One line about the context, for the UI."""
+        sections = ', '.join(f"{name} {tokens}" for name, tokens in self.usage.items() if tokens)
+        line = (f"Contexto: ~{self.tokens} de {self.budget} tokens ({sections}); "
+                f"{self.kept} de {self.total} mensagens na íntegra")
+        if self.truncated:
+            line += f", {self.truncated} blocos cortados"
+        if self.duplicates:
+            line += f", {self.duplicates} repetições omitidas"
+        return line + "."
+
+
+class _Renderer:
+    """Renders messages newest first, remembering the content already written."""
+
+    def __init__(self, icons):
+        self.labels = _LABELS[icons]
+        self.seen = set()
+        self.duplicates = 0
+        self.truncated = 0
+
+    def _block(self, text, max_tokens, label):
+        text = str(text).strip()
+        key = (label, text)
+        if estimate_tokens(text) >= DUPLICATE_MIN_TOKENS and key in self.seen:
+            self.duplicates += 1
+            return None
+        self.seen.add(key)
+        cut = truncate(text, max_tokens, label)
+        if cut is not text:
+            self.truncated += 1
+        return cut
+
+    def render(self, msg):
+        """(line, tokens per section) of one message, or (None, None) if it is empty.
+
+        Repeated texts and blocks are written as a short placeholder, so the
+        conversation still shows that the message was sent.
+        """
+        role = "Cliente" if msg.get('message_direction') == 'received' else "Atendente"
+        usage = dict.fromkeys(SECTIONS, 0)
+        parts = []
+        text = msg.get('message_text')
+        if _present(text) and str(text).strip():
+            text = self._block(text, TEXT_MAX_TOKENS, 'texto')
+            parts.append(text if text is not None else '(mensagem repetida)')
+        urls = []
+        for column in ('file_url', 'attachment_url'):
+            url = msg.get(column)
+            if _present(url) and url not in urls:
+                urls.append(url)
+        name = msg.get('attachment_filename')
+        name = name if _present(name) else 'Arquivo'
+        for url in urls:
+            parts.append(self.labels['attachment'].format(name=name, url=url))
+            usage['anexos'] += estimate_tokens(parts[-1]) + 1
+        for column, label, max_tokens, section in (
+            ('ocr_scan', 'ocr', OCR_MAX_TOKENS, 'ocr'),
+            ('audio_transcription', 'transcription', TRANSCRIPTION_MAX_TOKENS, 'transcricoes'),
+        ):
+            value = msg.get(column)
+            if not _present(value):
+                continue
+            block = self._block(value, max_tokens, section)
+            if block is None:
+                block = '(repetido; ver mais abaixo)'
+            parts.append(self.labels[label] + block)
+            usage[section] += estimate_tokens(parts[-1]) + 1
+        if not parts:
+            return None, None
+        line = f"{role}: " + "\n".join(parts)
+        usage['mensagens'] = max(estimate_tokens(line) + 1 - sum(usage.values()), 0)
+        return line, usage
+
+
+def _flagged(msg, column):
+    value = msg.get(column)
+    return _present(value) and bool(value)
+
+
+def _payload_tokens(msg):
+    """Most tokens the OCR and transcription blocks of a message can take.
+
+    From the stored sizes (characters) when known, otherwise the block limit.
+    """
+    tokens = 0
+    for flag, size_column, max_tokens in (('has_ocr', 'ocr_size', OCR_MAX_TOKENS),
+                                          ('has_audio', 'audio_size', TRANSCRIPTION_MAX_TOKENS)):
+        if not _flagged(msg, flag):
+            continue
+        size = msg.get(size_column)
+        # A character takes at most 4 bytes, i.e. one estimated token
+        block = max_tokens if not _present(size) else min(max_tokens, int(size))
+        tokens += block + BLOCK_OVERHEAD_TOKENS
+    return tokens
+
+
+def _fitting_start(records, available, icons):
+    """Position of the oldest of the newest `records` that fit in `available`
+    tokens, judged from their light columns before the texts are loaded.
+    """
+    renderer = _Renderer(icons)
+    used = 0
+    for position in range(len(records) - 1, -1, -1):
+        line, line_usage = renderer.render(records[position])
+        tokens = (sum(line_usage.values()) if line is not None else 0) + _payload_tokens(records[position])
+        if used + tokens > available:
+            return position + 1
+        used += tokens
+    return 0
+
+
+def _omitted_note(messages):
+    """Line standing for messages left out of the context."""
+    dates = pd.to_datetime(messages['created_at'])
+    note = (f"[{len(messages)} mensagens anteriores, de {dates.min():%d/%m/%Y} a "
+            f"{dates.max():%d/%m/%Y}, omitidas por tamanho.")
+    if 'attachment_filename' in messages:
+        names = list(dict.fromkeys(messages['attachment_filename'].dropna().astype(str)))
+        if names:
+            listed = ', '.join(names[-OMITTED_FILES_MAX:])
+            more = len(names) - OMITTED_FILES_MAX
+            note += f" Anexos enviados nelas: {listed}" + (f" e mais {more}" if more > 0 else "") + "."
+    return truncate(note + "]", OMITTED_NOTE_TOKENS, 'lista')
+
+
+def build_conversation(messages, budget=DEFAULT_BUDGET, icons=False, load_payloads=None):
+    """ConversationContext of a message history, oldest message first.
+
+    `messages` is a history DataFrame (message_direction, message_text,
+    file_url, attachment_url, attachment_filename, ocr_scan,
+    audio_transcription, created_at). `icons` marks attachments, OCR and
+    transcriptions with emoji, as the summary prompt does.
+
+    With `load_payloads`, `messages` has the has_* flags and sizes instead of
+    the texts; `load_payloads(message_uids)` returns {message_uid: {'ocr_scan':
+    ..., 'audio_transcription': ...}} and is called once, for the flagged
+    messages among those that fit. Older messages are left out.
+    """
+    messages = messages.sort_values('created_at', ascending=True)
+    records = messages.to_dict('records')
+    available = budget - OMITTED_NOTE_TOKENS
+    first = 0
+    if load_payloads is not None:
+        first = _fitting_start(records, available, icons)
+        wanted = [record['message_uid'] for record in records[first:]
+                  if _flagged(record, 'has_ocr') or _flagged(record, 'has_audio')]
+        payloads = load_payloads(wanted) if wanted else {}
+        for record in records[first:]:
+            payload = payloads.get(record['message_uid'], {})
+            record['ocr_scan'] = payload.get('ocr_scan')
+            record['audio_transcription'] = payload.get('audio_transcription')
+    renderer = _Renderer(icons)
+    usage = dict.fromkeys(SECTIONS, 0)
+    lines = []
+    start = first
+    for position in range(len(records) - 1, first - 1, -1):
+        line, line_usage = renderer.render(records[position])
+        if line is None:
+            continue
+        tokens = sum(line_usage.values())
+        if sum(usage.values()) + tokens > available:
+            start = position + 1
+            break
+        lines.append(line)
+        for section, section_tokens in line_usage.items():
+            usage[section] += section_tokens
+    # Only the messages written out count as kept; empty ones render no line
+    kept = len(lines)
+    lines.reverse()
+    if start:
+        note = _omitted_note(messages.iloc[:start])
+        lines.insert(0, note)
+        usage['omitidas'] = estimate_tokens(note) + 1
+    return ConversationContext(
+        "\n".join(lines), usage, kept, len(records), budget,
+        renderer.duplicates, renderer.truncated,
+    )
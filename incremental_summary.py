@@ -0,0 +1,87 @@
+"""Lead summaries refreshed from the messages received since the last one.
+
+Every generated summary is posted to the lead's Monday item with a footer
+naming the newest message it covered (the watermark):
+
+    ---
+    Gerado com Rosenbaum AI · mensagens até 2026-10-17T14:32:05.123456Z
+
+The next refresh reads that summary and watermark back from the item's
+updates and asks Grok to update the previous summary with the newer
+messages only, so a lead refreshed daily costs about the same each time
+however long its history grows. Without a previous summary (or one posted
+before watermarks existed) the whole history is summarized as before.
+
+Only messages created after the watermark count as new. A message that
+reaches the database late, with a created_at older than a summary already
+posted, is therefore left out of every incremental refresh; it is covered
+again when the summary is regenerated from the whole history ("Forçar nova
+geração").
+"""
+import html
+import re
+
+import pandas as pd
+
+SUMMARY_MARKER = "Gerado com Rosenbaum AI"
+
+_FOOTER = re.compile(re.escape(SUMMARY_MARKER) + r"\s*·\s*mensagens até\s*(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d+)?Z)")
+_BREAK = re.compile(r"<br\s*/?>|</p>|</div>|</li>", re.I)
+_TAG = re.compile(r"<[^>]+>")
+
+
+def format_watermark(watermark):
+    return pd.Timestamp(watermark).tz_convert('UTC').strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def format_summary_update(summary, watermark):
+    """Body of the Monday update holding `summary` and the watermark it covers."""
+    return f"{summary}\n\n---\n{SUMMARY_MARKER} · mensagens até {format_watermark(watermark)}"
+
+
+def _plain_text(body):
+    """Text of a Monday update body, which Monday stores as HTML."""
+    return html.unescape(_TAG.sub('', _BREAK.sub('\n', body)))
+
+
+def last_summary(updates):
+    """(summary, watermark) of the newest summary among Monday updates, or (None, None).
+
+    Summaries posted without a watermark are ignored.
+    """
+    found = None
+    for update in updates:
+        text = _plain_text(update.get('body') or '')
+        match = _FOOTER.search(text)
+        if match is None:
+            continue
+        watermark = pd.Timestamp(match.group(1))
+        if '.' not in match.group(1):
+            # Older footers were written to the second and covered all of it
+            watermark += pd.Timedelta(seconds=1) - pd.Timedelta(microseconds=1)
+        if found is None or watermark > found[1]:
+            summary = text[:match.start()].rstrip()
+            if summary.endswith('---'):
+                summary = summary[:-3].rstrip()
+            found = (summary, watermark)
+    return found if found is not None else (None, None)
+
+
+def messages_since(messages, watermark):
+    """Messages created after `watermark` (all of them if it is None)."""
+    if watermark is None or messages.empty:
+        return messages
+    created_at = pd.to_datetime(messages['created_at'], utc=True)
+    return messages[created_at > watermark]
+
+
+def updates_since(updates, watermark):
+    """Monday updates created after `watermark`; those without a date are kept."""
+    if watermark is None:
+        return updates
+    recent = []
+    for update in updates:
+        created_at = pd.to_datetime(update.get('created_at'), utc=True, errors='coerce')
+        if pd.isna(created_at) or created_at > watermark:
+            recent.append(update)
+    return recent
@@ -0,0 +1,203 @@
+"""Precomputed filter and sort index over the lead list.
+
+Built once per data version; each rerun of the list view then filters with
+a few NumPy operations on these arrays and reads its page off a presorted
+permutation, instead of copying, re-filtering and sorting the whole frame.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from contact_keys import contact_positions
+from message_search import rank_leads
+from trigram_index import TrigramIndex
+
+
+def _day_keys(series):
+    """Calendar day of each timestamp as int32 days since 1970-01-01.
+
+    Days are taken in the column's own time zone, like `.dt.date`. Missing
+    values get no key and are reported in the returned validity mask.
+    """
+    values = pd.to_datetime(series, errors='coerce')
+    if values.dt.tz is not None:
+        values = values.dt.tz_localize(None)
+    valid = values.notna().to_numpy()
+    days = values.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+    return np.where(valid, days, 0).astype(np.int32), valid
+
+
+# Permutation entries scanned at a time when collecting a page
+_PAGE_CHUNK = 4096
+
+# Filter combinations whose mask is kept, so reruns with unchanged filters
+# only pay for their page
+_MASK_CACHE_SIZE = 8
+
+
+def day_key(date):
+    """int32 day key of a date, comparable with the index's day keys."""
+    return np.int32(np.datetime64(date, 'D').astype(np.int64))
+
+
+class LeadIndex:
+    """Masks, day keys, board codes and sort orders of one version of the lead list."""
+
+    def __init__(self, frame):
+        self.size = len(frame)
+        self._frame = frame
+        self._orders = {}
+        self._title_index = None
+        self._contacts = None
+        self._summary = None
+        self._masks = OrderedDict()
+        # The index is shared by every session; reruns look up masks concurrently
+        self._masks_lock = threading.Lock()
+        boards = frame['board'].astype('category')
+        self._board_codes = boards.cat.codes.to_numpy()
+        self._board_code = {board: code for code, board in enumerate(boards.cat.categories)}
+        self.has_email = (frame['email_count'] > 0).to_numpy()
+        self.has_ocr = (frame['ocr_count'] > 0).to_numpy()
+        self.has_audio = (frame['audio_count'] > 0).to_numpy()
+        self.created_day, self.created_valid = _day_keys(frame['created_at'])
+        self.last_message_day, self.last_message_valid = _day_keys(frame['last_message'])
+
+    def _date_mask(self, days, valid, date_range):
+        start, end = date_range
+        return valid & (days >= day_key(start)) & (days <= day_key(end))
+
+    def mask(self, board=None, has_email=None, has_ocr=None, has_audio=None,
+             created=None, last_message=None):
+        """Return a boolean mask of the leads matching every given filter.
+
+        `has_*` filters are True (with), False (without) or None (any); date
+        filters are inclusive (start, end) date pairs or None.
+        """
+        mask = np.ones(self.size, dtype=bool)
+        for flags, wanted in ((self.has_email, has_email), (self.has_ocr, has_ocr),
+                              (self.has_audio, has_audio)):
+            if wanted is not None:
+                mask &= flags if wanted else ~flags
+        if created is not None:
+            mask &= self._date_mask(self.created_day, self.created_valid, created)
+        if last_message is not None:
+            mask &= self._date_mask(self.last_message_day, self.last_message_valid, last_message)
+        if board is not None:
+            code = self._board_code.get(board)
+            mask &= self._board_codes == code if code is not None else False
+        return mask
+
+    def title_mask(self, query):
+        """Mask of the leads whose title contains `query`, ignoring case and accents.
+
+        The trigram index is built by the first search on this version.
+        """
+        if self._title_index is None:
+            self._title_index = TrigramIndex(self._frame['title'])
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self._title_index.search(query)] = True
+        return mask
+
+    def contact_positions(self):
+        """Positions of the leads by normalized phone and by normalized email.
+
+        Computed on first use, to find the leads of message search hits.
+        """
+        if self._contacts is None:
+            self._contacts = contact_positions(self._frame)
+        return self._contacts
+
+    def summary(self):
+        """Totals, per-board counts and date bounds of the whole list.
+
+        Computed on first use from the index arrays, then reused for the life
+        of this version.
+        """
+        if self._summary is None:
+            frame = self._frame
+            counts = np.bincount(self._board_codes[self._board_codes >= 0],
+                                 minlength=len(self._board_code))
+            board_counts = {board: int(counts[code]) for board, code in sorted(self._board_code.items())}
+            self._summary = {
+                'total': self.size,
+                'with_ocr': int(self.has_ocr.sum()),
+                'with_email': int(self.has_email.sum()),
+                'with_audio': int(self.has_audio.sum()),
+                'boards': list(board_counts),
+                'board_counts': board_counts,
+                'created_range': (frame['created_at'].min(), frame['created_at'].max()),
+                'last_message_range': (frame['last_message'].min(), frame['last_message'].max()),
+            }
+        return self._summary
+
+    def _filtered(self, title=None, **filters):
+        """(mask, count) of mask() plus a title search, reused for recent filters.
+
+        The returned mask is shared: callers must not modify it.
+        """
+        key = (title, tuple(sorted(filters.items())))
+        with self._masks_lock:
+            if key in self._masks:
+                self._masks.move_to_end(key)
+                return self._masks[key]
+        # Computed outside the lock; two sessions missing at once both compute it
+        mask = self.mask(**filters)
+        if title:
+            mask &= self.title_mask(title)
+        entry = (mask, int(mask.sum()))
+        with self._masks_lock:
+            self._masks[key] = entry
+            self._masks.move_to_end(key)
+            while len(self._masks) > _MASK_CACHE_SIZE:
+                self._masks.popitem(last=False)
+        return entry
+
+    def select(self, start, stop, sort='last_message', ascending=False, **filters):
+        """Return (rows start..stop in the given order, number of matching leads).
+
+        Filters are those of mask(), plus a `title` search.
+        """
+        mask, total = self._filtered(**filters)
+        return self._frame.take(self.page(mask, sort, ascending, start, stop)), total
+
+    def search_leads(self, hits, limit=20, **filters):
+        """Leads owning message search hits, best first, among the filtered ones.
+
+        See message_search.rank_leads for the columns added to the rows.
+        """
+        mask, _ = self._filtered(**filters)
+        return rank_leads(hits, self._frame, self.contact_positions(), mask=mask, limit=limit)
+
+    def order(self, column, ascending=False):
+        """Stable permutation sorting the list by `column` (missing values last).
+
+        Computed on first use, then reused for the life of this version.
+        """
+        key = (column, ascending)
+        if key not in self._orders:
+            values = self._frame[column].reset_index(drop=True)
+            self._orders[key] = values.sort_values(
+                ascending=ascending, kind='stable', na_position='last'
+            ).index.to_numpy()
+        return self._orders[key]
+
+    def page(self, mask, column, ascending, start, stop):
+        """Positions of the matching leads ranked start..stop in the given order.
+
+        The permutation is scanned in chunks only until `stop` matches are
+        found, so the first pages cost about as much as their size.
+        """
+        permutation = self.order(column, ascending)
+        found, remaining = [], stop
+        for offset in range(0, self.size, _PAGE_CHUNK):
+            chunk = permutation[offset:offset + _PAGE_CHUNK]
+            hits = chunk[mask[chunk]]
+            found.append(hits)
+            remaining -= len(hits)
+            if remaining <= 0:
+                break
+        if not found:
+            return np.empty(0, dtype=np.intp)
+        return np.concatenate(found)[start:stop]
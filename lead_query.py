@@ -0,0 +1,201 @@
+"""Lead list pages filtered, sorted and paginated by the warehouse.
+
+The alternative to holding the whole list in every process (LeadStore and
+LeadIndex): the filters, title search and sort key of the list view are
+compiled into a parameterized query over `queries/lead_list.sql`, which
+returns one page and the total count. Both expose the same summary(),
+select() and search_leads() methods.
+
+Pick the mode with an environment variable:
+
+    ROSENBAUM_LEAD_LIST=auto       (default) server once the lead snapshot
+                                   holds more than MEMORY_LIMIT leads
+    ROSENBAUM_LEAD_LIST=memory
+    ROSENBAUM_LEAD_LIST=server
+"""
+import os
+import threading
+from datetime import datetime, time, timedelta
+
+import pandas as pd
+import pytz
+
+from contact_keys import contact_positions
+from lead_store import REFRESH_INTERVAL, prepare_leads
+from message_search import rank_leads
+from query_backend import read_query
+from trigram_index import fold
+
+# Above this many leads, `auto` stops loading the whole list into memory
+MEMORY_LIMIT = 200_000
+
+# Columns the list can be sorted by; anything else is rejected
+SORT_COLUMNS = ('created_at', 'last_message', 'message_count', 'ocr_count', 'audio_count', 'email_count')
+
+# Days of created_at are UTC days, like the column; those of last_message
+# are days in São Paulo, where the list shows it
+_CREATED_TZ = pytz.utc
+_LAST_MESSAGE_TZ = pytz.timezone('America/Sao_Paulo')
+
+# Same folding as trigram_index.fold, in SQL
+_FOLDED_TITLE = "LOWER(REGEXP_REPLACE(NORMALIZE(title, NFKD), r'\\pM', ''))"
+
+_SUMMARY_SQL = """
+SELECT
+    board,
+    COUNT(*) as leads,
+    COUNT(CASE WHEN ocr_count > 0 THEN 1 END) as with_ocr,
+    COUNT(CASE WHEN email_count > 0 THEN 1 END) as with_email,
+    COUNT(CASE WHEN audio_count > 0 THEN 1 END) as with_audio,
+    MIN(created_at) as created_min,
+    MAX(created_at) as created_max,
+    MIN(last_message) as last_message_min,
+    MAX(last_message) as last_message_max
+FROM ({leads}) leads
+GROUP BY board
+"""
+
+
+def list_mode(total_leads=None):
+    """'memory' or 'server', from ROSENBAUM_LEAD_LIST and the size of the list."""
+    mode = os.environ.get('ROSENBAUM_LEAD_LIST', 'auto')
+    if mode == 'auto':
+        return 'server' if total_leads is not None and total_leads > MEMORY_LIMIT else 'memory'
+    if mode not in ('memory', 'server'):
+        raise ValueError(f"Modo de lista desconhecido: {mode}")
+    return mode
+
+
+def _day_bounds(date_range, tz):
+    """[start, end) timestamps of an inclusive (start, end) date range in `tz`."""
+    start, end = date_range
+    return (
+        tz.localize(datetime.combine(start, time())),
+        tz.localize(datetime.combine(end + timedelta(days=1), time())),
+    )
+
+
+def compile_filters(board=None, has_email=None, has_ocr=None, has_audio=None,
+                    created=None, last_message=None, title=None,
+                    phone_keys=None, email_keys=None):
+    """WHERE clause and parameters of the list filters, as in LeadIndex.mask.
+
+    `title` is a plain substring, matched ignoring case and accents;
+    `phone_keys` / `email_keys` keep the leads with any of these normalized
+    keys.
+    """
+    conditions, params = [], {}
+    if board is not None:
+        conditions.append('board = @board')
+        params['board'] = board
+    for column, wanted in (('email_count', has_email), ('ocr_count', has_ocr),
+                           ('audio_count', has_audio)):
+        if wanted is not None:
+            conditions.append(f"{column} {'>' if wanted else '='} 0")
+    for column, date_range, tz in (('created_at', created, _CREATED_TZ),
+                                   ('last_message', last_message, _LAST_MESSAGE_TZ)):
+        if date_range is not None:
+            conditions.append(f'{column} >= @{column}_from AND {column} < @{column}_until')
+            params[f'{column}_from'], params[f'{column}_until'] = _day_bounds(date_range, tz)
+    if title:
+        conditions.append(f'STRPOS({_FOLDED_TITLE}, @title) > 0')
+        params['title'] = fold(title)
+    if phone_keys or email_keys:
+        keys = []
+        if phone_keys:
+            keys.append('`zapy-306602.gtms.normalize_phone`(phone) IN UNNEST(@phone_keys)')
+            params['phone_keys'] = sorted(phone_keys)
+        if email_keys:
+            keys.append('`zapy-306602.gtms.normalize_email`(email) IN UNNEST(@email_keys)')
+            params['email_keys'] = sorted(email_keys)
+        conditions.append('(' + ' OR '.join(keys) + ')')
+    where = 'WHERE ' + '\n    AND '.join(conditions) if conditions else ''
+    return where, params
+
+
+class LeadQuery:
+    """The lead list view served by queries, one page at a time.
+
+    `run_query(sql, params)` executes a query and returns a DataFrame; with a
+    result cache behind it, pages and summaries are shared across processes
+    until the leads scope is invalidated.
+    """
+
+    def __init__(self, run_query):
+        self._run_query = run_query
+        self._leads_sql = read_query('lead_list.sql')
+        self._lock = threading.Lock()
+        # (computed at, summary), reused for REFRESH_INTERVAL or until invalidate()
+        self._summary = None
+
+    def _compute_summary(self):
+        boards = self._run_query(_SUMMARY_SQL.format(leads=self._leads_sql), {})
+        last_message = pd.to_datetime(boards[['last_message_min', 'last_message_max']].stack(), utc=True)
+        last_message = last_message.dt.tz_convert(_LAST_MESSAGE_TZ)
+        named = boards.dropna(subset=['board'])
+        board_counts = {board: int(leads) for board, leads in sorted(zip(named['board'], named['leads']))}
+        return {
+            'total': int(boards['leads'].sum()),
+            'with_ocr': int(boards['with_ocr'].sum()),
+            'with_email': int(boards['with_email'].sum()),
+            'with_audio': int(boards['with_audio'].sum()),
+            'boards': list(board_counts),
+            'board_counts': board_counts,
+            'created_range': (boards['created_min'].min(), boards['created_max'].max()),
+            'last_message_range': (last_message.min(), last_message.max()),
+        }
+
+    def summary(self):
+        """Totals, per-board counts and date bounds of the whole list, as LeadIndex.summary.
+
+        One grouped query, reused for REFRESH_INTERVAL (the age the memory
+        mode's list may reach) or until invalidate().
+        """
+        with self._lock:
+            now = datetime.now()
+            if self._summary is None or now - self._summary[0] >= REFRESH_INTERVAL:
+                self._summary = (now, self._compute_summary())
+            return self._summary[1]
+
+    def invalidate(self):
+        """Recompute the summary on next use."""
+        with self._lock:
+            self._summary = None
+
+    def _count(self, where, params):
+        sql = f"SELECT COUNT(*) as total_count FROM ({self._leads_sql}) leads\n{where}"
+        return int(self._run_query(sql, params)['total_count'].iloc[0])
+
+    def select(self, start, stop, sort='last_message', ascending=False, **filters):
+        """Return (rows start..stop in the given order, number of matching leads).
+
+        Filters are those of compile_filters.
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Coluna de ordenação desconhecida: {sort}")
+        where, params = compile_filters(**filters)
+        sql = (
+            f"SELECT *, COUNT(*) OVER () as total_count FROM ({self._leads_sql}) leads\n{where}\n"
+            f"ORDER BY {sort} {'ASC' if ascending else 'DESC'} NULLS LAST, created_at DESC, id\n"
+            f"LIMIT @limit OFFSET @offset"
+        )
+        page = self._run_query(sql, {**params, 'limit': max(stop - start, 0), 'offset': start})
+        if page.empty:
+            # Past the last page the count comes back empty too
+            total = self._count(where, params) if start > 0 else 0
+        else:
+            total = int(page['total_count'].iloc[0])
+        return prepare_leads(page.drop(columns='total_count')), total
+
+    def search_leads(self, hits, limit=20, **filters):
+        """Leads owning message search hits, best first, among the filtered ones.
+
+        See message_search.rank_leads for the columns added to the rows.
+        """
+        phone_keys = set(hits['phone_key'].dropna())
+        email_keys = set(hits['email_key'].dropna())
+        if not phone_keys and not email_keys:
+            return rank_leads(hits, prepare_leads(pd.DataFrame()), ({}, {}), limit=limit)
+        where, params = compile_filters(phone_keys=phone_keys, email_keys=email_keys, **filters)
+        leads = prepare_leads(self._run_query(f"SELECT * FROM ({self._leads_sql}) leads\n{where}", params))
+        return rank_leads(hits, leads, contact_positions(leads), limit=limit)
@@ -0,0 +1,105 @@
+"""Incremental maintenance of the `lead_message_stats` rollup.
+
+The rollup holds, per normalized phone and per normalized email, the last
+message time and the message / OCR / audio / email counts that the lead list
+shows. Each run copies the messages created since the stored watermark
+under their normalized keys into `messages_by_lead`, replacing the rows it
+stored for that window before, and recomputes the counts of the keys they
+belong to with a MERGE, in the same transaction that advances the watermark.
+
+Messages can land in `gtms.messages` well after their created_at, and there
+is no ingestion time to select them by. The watermark therefore trails the
+newest message folded in by LATE_MESSAGE_LOOKBACK: each run re-reads that
+much history, and since it replaces rather than adds, a message read twice
+is counted once. Messages later than that are only picked up by --rebuild.
+
+Keys are normalized as in contact_keys.py. After changing those rules, or
+adding columns to `messages_by_lead`, run once with --rebuild to recompute
+everything from the messages table.
+
+Run it on a schedule, a few minutes apart:
+
+    python lead_stats_job.py
+    python lead_stats_job.py --local stats.duckdb --fixtures fixtures/
+    python lead_stats_job.py --rebuild
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from query_backend import BigQueryBackend, DuckDBBackend, read_query
+
+# How far behind the newest message the watermark stays, i.e. how late a
+# message may land and still be counted by the next run
+LATE_MESSAGE_LOOKBACK = timedelta(hours=6)
+
+# Watermark before the first run: nothing is settled yet
+NOTHING_SETTLED = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _utc(value):
+    value = pd.Timestamp(value)
+    return value.tz_localize('UTC') if value.tzinfo is None else value
+
+
+def settled_watermark(run_query):
+    """Watermark of the rollup, as a UTC datetime for query parameters.
+
+    `run_query` is a QueryBackend's run_query. Every message created up to
+    the watermark is in `messages_by_lead`; an older value than the stored
+    one is still correct, it only leaves more messages to read from
+    `gtms.messages`.
+    """
+    watermark = run_query(read_query('lead_message_stats_watermark.sql')).iloc[0]['watermark']
+    if pd.isna(watermark):
+        return NOTHING_SETTLED
+    return _utc(watermark).to_pydatetime()
+
+
+def update_lead_message_stats(backend, rebuild=False):
+    """Fold new and late messages into the rollup through a QueryBackend.
+
+    With `rebuild`, the rollup is emptied first and rebuilt from scratch.
+    Returns the newest message folded in, or None when there was nothing to add.
+    """
+    backend.run_script(read_query('contact_keys_setup.sql'))
+    backend.run_script(read_query('lead_message_stats_setup.sql'))
+    if rebuild:
+        backend.run_script(read_query('lead_message_stats_reset.sql'))
+    pending = backend.run_query(read_query('lead_message_stats_pending.sql')).iloc[0]
+    if pd.isna(pending['until']):
+        return None
+    since, until = _utc(pending['since']), _utc(pending['until'])
+    backend.run_script(read_query('lead_message_stats_update.sql'), {
+        'since': since.to_pydatetime(),
+        'until': until.to_pydatetime(),
+        'settled': (until - LATE_MESSAGE_LOOKBACK).to_pydatetime(),
+    })
+    return until
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--local', metavar='DATABASE',
+                        help='update a local DuckDB database instead of BigQuery')
+    parser.add_argument('--fixtures', metavar='DIR',
+                        help='Parquet fixtures for the local database (<dataset>/<table>.parquet)')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='recompute the rollup from all messages')
+    args = parser.parse_args()
+
+    if args.local:
+        backend = DuckDBBackend(args.local, args.fixtures)
+    else:
+        backend = BigQueryBackend()
+    watermark = update_lead_message_stats(backend, rebuild=args.rebuild)
+
+    if watermark is None:
+        print("Nenhuma mensagem nova.")
+    else:
+        print(f"lead_message_stats atualizado até {watermark.isoformat()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from arrow_frames import compact_frame
+from snapshot import read_snapshot, write_snapshot
+
+# Messages can land in the warehouse shortly after their created_at, so every
+# delta re-reads this window. Merging is idempotent, re-read rows just replace
+# themselves.
+DELTA_LOOKBACK = timedelta(minutes=10)
+
+# Leads edited or removed in Monday keep their created_at, which a delta cannot
+# see, so the whole list is still reloaded from time to time.
+FULL_REFRESH_INTERVAL = timedelta(hours=1)
+
+# Result cache scope of the lead list queries
+LEADS_SCOPE = 'leads'
+
+# How old the served lead list may get, and how long before that the
+# background refresher starts recomputing it
+REFRESH_INTERVAL = timedelta(minutes=5)
+REFRESH_MARGIN = timedelta(seconds=30)
+
+
+def prepare_leads(df):
+    """Normalize the columns of a lead list query result."""
+    # Dates are filtered and formatted as timestamps
+    if 'created_at' in df.columns:
+        df['created_at'] = pd.to_datetime(df['created_at'], errors='coerce')
+
+    # Convert last_message to São Paulo timezone (it comes in UTC)
+    if 'last_message' in df.columns:
+        df['last_message'] = pd.to_datetime(df['last_message'])
+        if df['last_message'].dt.tz is None:
+            df['last_message'] = df['last_message'].dt.tz_localize('UTC')
+        df['last_message'] = df['last_message'].dt.tz_convert('America/Sao_Paulo')
+
+    # Ensure email column exists and is string type
+    if 'email' not in df.columns:
+        df['email'] = ''
+    else:
+        df['email'] = df['email'].fillna('').astype(str)
+
+    # Add channel column based on email and phone
+    df['channel'] = 'whatsapp'  # default to whatsapp
+    df.loc[df['email'].str.len() > 0, 'channel'] = 'email'  # if email exists, set to email
+
+    return compact_frame(df)
+
+
+def merge_leads(current, delta):
+    """Replace the rows of `current` that were recomputed in `delta`."""
+    if delta.empty:
+        return current
+    kept = current[~current['id'].isin(delta['id'])]
+    merged = compact_frame(pd.concat([delta, kept], ignore_index=True))
+    return merged.sort_values('created_at', ascending=False, kind='stable', ignore_index=True)
+
+
+def _max_utc(series):
+    """Latest timestamp of a column as an aware UTC datetime, or None."""
+    values = pd.to_datetime(series, errors='coerce')
+    if values.dt.tz is None:
+        values = values.dt.tz_localize('UTC')
+    latest = values.max()
+    if pd.isna(latest):
+        return None
+    return latest.tz_convert('UTC').to_pydatetime()
+
+
+def _parse_utc(value):
+    """Parse an ISO timestamp stored in a snapshot header."""
+    if not value:
+        return None
+    return pd.Timestamp(value).tz_convert('UTC').to_pydatetime()
+
+
+class LeadStore:
+    """Lead list kept in memory and refreshed with delta queries.
+
+    `run_query(sql, params)` executes a query and returns a DataFrame. The first
+    refresh (and one every FULL_REFRESH_INTERVAL) runs `full_sql`; the others run
+    `delta_sql`, which only recomputes leads created or messaged after the
+    watermarks, and merge the result into the current frame.
+
+    With a `snapshot_path`, the frame and its watermarks are written to disk
+    after every refresh and read back on startup, so a new process can serve
+    the last known list right away while it reconciles with BigQuery.
+
+    Readers use `frame`, or `current()` for the frame with its version number;
+    a refresh replaces both in one assignment. The background refresher
+    (start_refresher) keeps the frame from getting older than
+    REFRESH_INTERVAL, so readers never wait on the periodic refresh.
+    """
+
+    def __init__(self, run_query, full_sql, delta_sql, snapshot_path=None):
+        self._run_query = run_query
+        self._full_sql = full_sql
+        self._delta_sql = delta_sql
+        self._snapshot_path = snapshot_path
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._refresher_lock = threading.Lock()
+        self._stop = threading.Event()
+        # (version, frame): the version counts completed refreshes, which
+        # also lets callers that waited on one reuse it
+        self._current = (0, None)
+        self.refreshed_at = None
+        self.leads_watermark = None
+        self.messages_watermark = None
+        self.last_full_refresh = None
+        # False while the frame only comes from the on-disk snapshot
+        self.reconciled = False
+        if snapshot_path:
+            self._load_snapshot()
+
+    def _load_snapshot(self):
+        frame, header = read_snapshot(self._snapshot_path)
+        if frame is None:
+            return
+        self._current = (0, frame)
+        self.leads_watermark = _parse_utc(header.get('leads_watermark'))
+        self.messages_watermark = _parse_utc(header.get('messages_watermark'))
+        self.last_full_refresh = _parse_utc(header.get('last_full_refresh'))
+        self.refreshed_at = _parse_utc(header.get('written_at'))
+
+    def _save_snapshot(self):
+        try:
+            write_snapshot(
+                self._snapshot_path,
+                self.frame,
+                leads_watermark=self.leads_watermark,
+                messages_watermark=self.messages_watermark,
+                last_full_refresh=self.last_full_refresh,
+            )
+        except Exception as e:
+            print(f"Erro ao salvar snapshot: {str(e)}")
+
+    def _needs_full_refresh(self, now):
+        return (
+            self.frame is None
+            or self.leads_watermark is None
+            or self.messages_watermark is None
+            or self.last_full_refresh is None
+            or now - self.last_full_refresh >= FULL_REFRESH_INTERVAL
+        )
+
+    @property
+    def frame(self):
+        return self._current[1]
+
+    @property
+    def version(self):
+        return self._current[0]
+
+    def current(self):
+        """Return (version, frame), read together."""
+        return self._current
+
+    def age(self):
+        """How old the current frame is, or None before the first load."""
+        if self.refreshed_at is None:
+            return None
+        return datetime.now(timezone.utc) - self.refreshed_at
+
+    def refresh(self, full=False, force=False):
+        """Bring the lead list up to date and return it.
+
+        Single-flight: a caller that waited for a refresh already running
+        gets that refresh's result instead of starting another one. With
+        `force` (a user asking for fresh data) or `full`, the caller waits
+        for the running refresh and then runs its own, so it sees the
+        changes made after that refresh started.
+        """
+        version = self.version
+        with self._lock:
+            if self.version != version and not (full or force):
+                return self.frame
+            now = datetime.now(timezone.utc)
+            if full or self._needs_full_refresh(now):
+                frame = prepare_leads(self._run_query(self._full_sql, {}))
+                self.last_full_refresh = now
+            else:
+                delta = prepare_leads(self._run_query(self._delta_sql, {
+                    'leads_since': self.leads_watermark - DELTA_LOOKBACK,
+                    'messages_since': self.messages_watermark - DELTA_LOOKBACK,
+                }))
+                frame = merge_leads(self.frame, delta)
+
+            self._current = (self.version + 1, frame)
+            self.leads_watermark = _max_utc(frame['created_at']) or self.leads_watermark
+            self.messages_watermark = _max_utc(frame['last_message']) or self.messages_watermark
+            self.refreshed_at = now
+            self.reconciled = True
+            if self._snapshot_path:
+                self._save_snapshot()
+            return frame
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Erro ao atualizar leads em segundo plano: {str(e)}")
+
+    def _next_refresh_in(self):
+        """Seconds until the frame should be recomputed (0 if overdue)."""
+        if self.frame is None or not self.reconciled or self.refreshed_at is None:
+            return 0.0
+        due = self.refreshed_at + REFRESH_INTERVAL - REFRESH_MARGIN
+        return max(0.0, (due - datetime.now(timezone.utc)).total_seconds())
+
+    def start_refresher(self):
+        """Start the daemon thread refreshing the list shortly before it expires."""
+        # Not self._lock: that one is held for the duration of a refresh
+        with self._refresher_lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._stop.clear()
+            self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._refresher.start()
+
+    def stop_refresher(self):
+        self._stop.set()
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self._next_refresh_in()):
+            self._background_refresh()
+            if self._next_refresh_in() == 0:
+                # The refresh failed: retry later instead of spinning
+                self._stop.wait(REFRESH_MARGIN.total_seconds())
@@ -0,0 +1,81 @@
+"""Grok answers shared by every process that opens the same cache file.
+
+An answer is stored under a hash of everything that determines it: the
+feature, the model, the messages sent (system prompt and rendered
+conversation) and the temperature. Generating again for a lead whose
+conversation has not changed, from any tab or worker, then reads the stored
+text instead of paying for the same tokens.
+
+Like ResultCache, entries expire after a TTL and the least recently read
+ones are evicted past a size bound. Hits and misses are counted per feature
+in the same file.
+"""
+import time
+
+from result_cache import result_key
+from sqlite_store import SQLiteStore, evict
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (
+    key TEXT PRIMARY KEY,
+    feature TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    feature TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def output_key(feature, model, messages, temperature):
+    """Hash of everything a generated answer depends on."""
+    return result_key('llm', feature, model, messages, temperature)
+
+
+class LLMCache(SQLiteStore):
+    """Generated texts cached in a SQLite file, with a TTL and a size bound."""
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_bytes=64 * 1024 * 1024):
+        super().__init__(path, _SCHEMA)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def get(self, key, feature):
+        """Return the cached text for `key`, or None; counts a hit or a miss of `feature`."""
+        now = time.time()
+        with self._write() as con:
+            row = con.execute(
+                'SELECT text FROM outputs WHERE key = ? AND created_at > ?',
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is not None:
+                con.execute('UPDATE outputs SET accessed_at = ? WHERE key = ?', (now, key))
+            counter = 'hits' if row is not None else 'misses'
+            con.execute(
+                f'INSERT INTO counters (feature, {counter}) VALUES (?, 1) '
+                f'ON CONFLICT (feature) DO UPDATE SET {counter} = {counter} + 1',
+                (feature,),
+            )
+        return None if row is None else row[0]
+
+    def put(self, key, feature, text):
+        now = time.time()
+        size = len(text.encode('utf-8'))
+        with self._write() as con:
+            con.execute(
+                'INSERT OR REPLACE INTO outputs (key, feature, created_at, accessed_at, size, text) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, feature, now, now, size, text),
+            )
+            evict(con, 'outputs', now, self.ttl, self.max_bytes)
+
+    def stats(self):
+        """{feature: (hits, misses)} since the file was created."""
+        with self._connect() as con:
+            rows = con.execute('SELECT feature, hits, misses FROM counters').fetchall()
+        return {feature: (hits, misses) for feature, hits, misses in rows}
@@ -0,0 +1,197 @@
+"""Single entry point for the chat completions the app asks Grok for.
+
+Every feature (lead summary, reply suggestion, missing documents, the lead
+chat) sends the same request shape through one long-lived HTTP client, so
+repeated generations reuse pooled keep-alive connections (HTTP/2 when the
+`h2` package is installed) instead of paying a TLS handshake each time.
+
+Timeouts are per feature. Connection errors, 429 and 5xx responses are
+retried a bounded number of times with jittered exponential backoff.
+stream() yields the answer as it is generated (server-sent events), for
+st.write_stream. With an LLMCache, it reuses the stored answer to the same
+request unless asked to regenerate it.
+"""
+import json
+import random
+import sqlite3
+import threading
+import time
+
+import httpx
+
+from llm_cache import output_key
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+API_URL = "https://api.x.ai/v1/chat/completions"
+DEFAULT_MODEL = "grok-3-latest"
+
+# Seconds to wait for each feature's response (reading a long answer can
+# take a while; connecting should not)
+FEATURE_TIMEOUTS = {
+    'summary': 90.0,
+    'suggestion': 60.0,
+    'documents': 90.0,
+    'chat': 60.0,
+}
+DEFAULT_TIMEOUT = 60.0
+CONNECT_TIMEOUT = 10.0
+
+# Attempts per request, and the backoff before each retry: a random delay
+# up to BACKOFF_BASE * 2**retry seconds, capped at BACKOFF_MAX
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """A completion could not be obtained after the allowed attempts."""
+
+
+def chat_messages(system_prompt, prompt):
+    """The messages of a request made of a system prompt and one user prompt."""
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def _sse_text(lines):
+    """Text deltas of a streamed chat completion, from its server-sent event lines."""
+    for line in lines:
+        if not line.startswith('data:'):
+            continue
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            return
+        choices = json.loads(data).get('choices') or []
+        if choices:
+            text = (choices[0].get('delta') or {}).get('content')
+            if text:
+                yield text
+
+
+def _backoff(retry, retry_after=None):
+    """Seconds to wait before retry number `retry` (0-based)."""
+    if retry_after is not None:
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** retry))
+
+
+class LLMGateway:
+    """Chat completions over one pooled, thread-safe httpx client."""
+
+    def __init__(self, api_key, model=DEFAULT_MODEL, url=API_URL, cache=None):
+        self.model = model
+        self.url = url
+        self.cache = cache
+        self._api_key = api_key
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        # Created on first use; httpx clients are safe to share across threads
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(
+                    http2=HTTP2,
+                    headers={
+                        "Authorization": f"Bearer {self._api_key}",
+                        "Content-Type": "application/json",
+                    },
+                    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10,
+                                        keepalive_expiry=120.0),
+                    timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=CONNECT_TIMEOUT),
+                )
+            return self._client
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    def _timeout(self, feature):
+        return httpx.Timeout(FEATURE_TIMEOUTS.get(feature, DEFAULT_TIMEOUT), connect=CONNECT_TIMEOUT)
+
+    def _payload(self, messages, temperature):
+        return {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "stream": True,
+        }
+
+    def lookup(self, feature, messages, temperature=0.7):
+        """The cached answer to this request, or None (also without a cache)."""
+        if self.cache is None:
+            return None
+        try:
+            return self.cache.get(output_key(feature, self.model, messages, temperature), feature)
+        except sqlite3.Error as e:
+            print(f"Erro no cache de respostas: {str(e)}")
+            return None
+
+    def _store(self, feature, messages, temperature, text):
+        if self.cache is None or not text:
+            return
+        try:
+            self.cache.put(output_key(feature, self.model, messages, temperature), feature, text)
+        except sqlite3.Error as e:
+            print(f"Erro no cache de respostas: {str(e)}")
+
+    def stream(self, feature, messages, temperature=0.7, refresh=False):
+        """Yield the text of the completion of `messages` as it is generated.
+
+        `feature` selects the timeout. A cached answer is yielded whole
+        unless `refresh`; a generated one is cached once complete.
+        Connection errors, 429 and 5xx responses are retried until the first
+        piece of text arrives; a failure after that, or once the retries are
+        exhausted, raises LLMError, since part of the answer may have been
+        shown.
+        """
+        if not refresh:
+            cached = self.lookup(feature, messages, temperature)
+            if cached is not None:
+                yield cached
+                return
+        parts = []
+        for text in self._stream(feature, messages, temperature):
+            parts.append(text)
+            yield text
+        self._store(feature, messages, temperature, ''.join(parts))
+
+    def _stream(self, feature, messages, temperature):
+        payload = self._payload(messages, temperature)
+        client = self._get_client()
+        started = False
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            retry_after = None
+            try:
+                with client.stream('POST', self.url, json=payload, timeout=self._timeout(feature)) as response:
+                    if response.status_code not in _RETRY_STATUS:
+                        response.raise_for_status()
+                        for text in _sse_text(response.iter_lines()):
+                            started = True
+                            yield text
+                        return
+                    error = f"HTTP {response.status_code}"
+                    retry_after = response.headers.get('Retry-After')
+            except httpx.TransportError as e:
+                if started:
+                    raise LLMError(f"Resposta interrompida: {str(e) or type(e).__name__}") from e
+                error = str(e) or type(e).__name__
+            except (httpx.HTTPStatusError, KeyError, IndexError, ValueError) as e:
+                raise LLMError(str(e)) from e
+            if attempt < MAX_ATTEMPTS:
+                time.sleep(_backoff(attempt - 1, retry_after))
+        raise LLMError(f"{error} após {MAX_ATTEMPTS} tentativas")
@@ -0,0 +1,102 @@
+"""Run the BigQuery SQL in `queries/` on a local DuckDB database.
+
+Only the handful of dialect differences the query files rely on are
+translated: project-qualified backtick table names become `dataset.table`,
+`@name` parameters become `$name`, `IN UNNEST(array)` becomes a subquery,
+`INT64` becomes `BIGINT`, `TIMESTAMP` becomes `TIMESTAMPTZ` (BigQuery
+timestamps are absolute), `CLUSTER BY` is dropped, SQL UDFs become macros,
+`NORMALIZE(x, NFKD)` becomes `strip_accents(x)` (it is only used to strip
+accents) and `REGEXP_REPLACE` with a raw-string pattern replaces every
+match.
+DuckDB understands `group by all`, `MERGE`, `QUALIFY` and `COUNT(CASE ...)`
+as they are.
+"""
+import glob
+import os
+import re
+
+import duckdb
+
+from arrow_frames import compact_batch, table_to_frame
+
+_TABLE_REF = re.compile(r'`[\w-]+\.(\w+)\.(\w+)`')
+_PARAMETER = re.compile(r'(?<![\w@])@(\w+)')
+_CLUSTER_BY = re.compile(r'\s+CLUSTER\s+BY\s+[\w\s,]+?(?=;|$)', re.IGNORECASE)
+_INT64 = re.compile(r'\bINT64\b', re.IGNORECASE)
+_TIMESTAMP = re.compile(r'\bTIMESTAMP\b', re.IGNORECASE)
+_IN_UNNEST = re.compile(r'\bIN\s+UNNEST\s*\(([^()]*)\)', re.IGNORECASE)
+_COMMENT = re.compile(r'--[^\n]*')
+_CREATE_FUNCTION = re.compile(r'\bCREATE\s+OR\s+REPLACE\s+FUNCTION\s+([\w.]+)\s*\(([^()]*)\)', re.IGNORECASE)
+_REGEXP_REPLACE = re.compile(
+    r"\bREGEXP_REPLACE\s*\(((?:[^()]|\([^()]*\))*?),\s*r'([^']*)',\s*('[^']*')\)", re.IGNORECASE
+)
+_NORMALIZE_NFKD = re.compile(r'\bNORMALIZE\s*\(([^()]*?),\s*NFKD\s*\)', re.IGNORECASE)
+
+
+def _macro(match):
+    # Macro arguments are untyped: `raw STRING` becomes `raw`
+    arguments = ', '.join(argument.split()[0] for argument in match.group(2).split(',') if argument.strip())
+    return f"CREATE OR REPLACE MACRO {match.group(1)}({arguments})"
+
+
+def to_duckdb(sql):
+    """Translate a BigQuery query or script to DuckDB SQL."""
+    sql = _COMMENT.sub('', sql)
+    sql = _TABLE_REF.sub(r'\1.\2', sql)
+    sql = _PARAMETER.sub(r'$\1', sql)
+    sql = _CLUSTER_BY.sub('', sql)
+    sql = _CREATE_FUNCTION.sub(_macro, sql)
+    sql = _NORMALIZE_NFKD.sub(r'strip_accents(\1)', sql)
+    sql = _REGEXP_REPLACE.sub(r"regexp_replace(\1, '\2', \3, 'g')", sql)
+    sql = _IN_UNNEST.sub(r'IN (SELECT unnest(\1))', sql)
+    sql = _INT64.sub('BIGINT', sql)
+    return _TIMESTAMP.sub('TIMESTAMPTZ', sql)
+
+
+def connect(database=':memory:', fixtures_dir=None):
+    """Open a DuckDB database, exposing Parquet fixtures as tables.
+
+    Each `<fixtures_dir>/<dataset>/<table>.parquet` file becomes a view named
+    `dataset.table`, matching the names used in the query files.
+    """
+    con = duckdb.connect(database)
+    con.execute("SET TimeZone = 'UTC'")
+    for dataset in ('gtms', 'dbt'):
+        con.execute(f"CREATE SCHEMA IF NOT EXISTS {dataset}")
+    if fixtures_dir:
+        for path in sorted(glob.glob(os.path.join(fixtures_dir, '*', '*.parquet'))):
+            dataset = os.path.basename(os.path.dirname(path))
+            table = os.path.splitext(os.path.basename(path))[0]
+            con.execute(f"CREATE SCHEMA IF NOT EXISTS {dataset}")
+            con.execute(
+                f"CREATE OR REPLACE VIEW {dataset}.{table} AS "
+                f"SELECT * FROM read_parquet('{path}')"
+            )
+    return con
+
+
+def _statements(sql):
+    return [statement.strip() for statement in sql.split(';') if statement.strip()]
+
+
+def _bind(statement, params):
+    """Keep only the parameters a statement actually references."""
+    names = set(re.findall(r'\$(\w+)', statement))
+    return {name: value for name, value in (params or {}).items() if name in names}
+
+
+def run_query(con, query, params=None):
+    """Run a single query and return its result as a DataFrame.
+
+    The result goes through the same Arrow compaction as BigQuery reads, so
+    both backends produce the same dtypes.
+    """
+    query = to_duckdb(query)
+    table = con.execute(query, _bind(query, params)).fetch_arrow_table()
+    return table_to_frame(compact_batch(table))
+
+
+def run_script(con, script, params=None):
+    """Run a multi-statement script, one statement at a time."""
+    for statement in _statements(to_duckdb(script)):
+        con.execute(statement, _bind(statement, params))
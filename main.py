@@ -1,11 +1,24 @@
 import streamlit as st
 import pandas as pd
-from google.cloud import bigquery
-from google.oauth2 import service_account
+import numpy as np
 from datetime import datetime, timedelta
 import pytz
 import os
 from monday_api import fetch_monday_updates
+from contact_keys import lead_keys
+from query_backend import backend_from_env, read_sql_file
+from lead_store import LEADS_SCOPE, LeadStore
+from lead_stats_job import settled_watermark
+from lead_index import LeadIndex
+from lead_query import LeadQuery, list_mode
+from snapshot import snapshot_rows
+from message_search import MessageSearch, index_path
+from context_builder import FEATURE_BUDGETS, PREVIOUS_SUMMARY_MAX_TOKENS, TEXT_MAX_TOKENS, UPDATE_MAX_TOKENS, UPDATES_BUDGET, build_conversation, fit_lines, truncate
+from incremental_summary import SUMMARY_MARKER, format_summary_update, last_summary, messages_since, updates_since
+from llm_cache import LLMCache
+from llm_gateway import LLMGateway, chat_messages
+from message_cache import FIRST_PAGE_CURSOR, MessageCache, MessageHistory, PayloadCache, lead_scope
+from functools import partial
 import httpx
 import re
 import urllib3
@@ -64,21 +77,27 @@ def strip_html_tags(text):
     
     return text
 
+def text_or_empty(value):
+    """Return a text value, or an empty string when it is missing."""
+    if value is None or pd.isna(value):
+        return ''
+    return value
+
 def calculate_response_time(messages_df):
     """Calculate response times between messages."""
     response_times = {}
     last_received_time = None
     last_received_idx = None
     
-    # Ensure created_at is datetime
-    messages_df['created_at'] = pd.to_datetime(messages_df['created_at'])
+    # Ensure created_at is datetime, without modifying the (shared) frame
+    created_at = pd.to_datetime(messages_df['created_at'])
     
-    for idx, msg in messages_df.iterrows():
-        if msg['message_direction'] == 'received':
-            last_received_time = msg['created_at']
+    for idx, direction, message_time in zip(messages_df.index, messages_df['message_direction'], created_at):
+        if direction == 'received':
+            last_received_time = message_time
             last_received_idx = idx
-        elif msg['message_direction'] == 'sent' and last_received_time is not None:
-            response_time = msg['created_at'] - last_received_time
+        elif direction == 'sent' and last_received_time is not None:
+            response_time = message_time - last_received_time
             response_times[idx] = response_time
             last_received_time = None
             last_received_idx = None
@@ -103,63 +122,85 @@ def format_response_time(timedelta):
         hours = (total_seconds % 86400) // 3600
         return f"{days}d {hours}h"
 
-# Initialize BigQuery client with service account credentials
-credentials = service_account.Credentials.from_service_account_info(
-    st.secrets["gcp_service_account"]
-)
-client = bigquery.Client(credentials=credentials, project="zapy-306602")
-
-# Read SQL query from file
-def read_sql_file(file_path):
-    with open(file_path, 'r') as file:
-        return file.read()
-
 # Get the directory of the current file
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sql_file_path = os.path.join(current_dir, 'queries', 'monday_sessions.sql')
+sql_delta_file_path = os.path.join(current_dir, 'queries', 'monday_sessions_delta.sql')
 messages_sql_path = os.path.join(current_dir, 'queries', 'lead_messages.sql')
+messages_batch_sql_path = os.path.join(current_dir, 'queries', 'lead_messages_batch.sql')
+payloads_sql_path = os.path.join(current_dir, 'queries', 'message_payloads.sql')
 
-def generate_lead_status_summary(messages, monday_info):
-    """Gera um resumo do status do lead usando IA."""
-    # Sort messages in ascending order (oldest first)
-    messages = messages.sort_values('created_at', ascending=True)
-    
-    # Prepare the conversation text
-    conversation = []
-    for _, msg in messages.iterrows():
-        role = "Cliente" if msg['message_direction'] == 'received' else "Atendente"
-        content = msg['message_text'] or ''
-        
-        # Add file information if present
-        if 'file_url' in msg and pd.notna(msg['file_url']):
-            content += f"\n📎 [Anexo: {msg.get('attachment_filename', 'Arquivo')}]({msg['file_url']})"
-        
-        # Add attachment URL if present
-        if 'attachment_url' in msg and pd.notna(msg['attachment_url']):
-            content += f"\n📎 [Anexo: {msg.get('attachment_filename', 'Arquivo')}]({msg['attachment_url']})"
-        
-        # Add OCR information if present
-        if 'ocr_scan' in msg and pd.notna(msg['ocr_scan']):
-            content += f"\n🔍 OCR: {msg['ocr_scan']}"
-        
-        # Add audio transcription if present
-        if 'audio_transcription' in msg and pd.notna(msg['audio_transcription']):
-            content += f"\n🎤 Transcrição: {msg['audio_transcription']}"
-        
-        conversation.append(f"{role}: {content}")
-    
-    conversation_text = "\n".join(conversation)
-    
+def stream_completion(feature, system_prompt, prompt, error_message, refresh=False):
+    """Escreve a resposta do Grok à medida que é gerada e retorna o texto completo.
+
+    Uma resposta já gerada para a mesma conversa e o mesmo prompt é
+    reaproveitada do cache, a menos que `refresh` peça uma nova geração.
+    """
+    try:
+        gateway = get_llm_gateway()
+        messages = chat_messages(system_prompt, prompt)
+        cached = None if refresh else gateway.lookup(feature, messages)
+        if cached is not None:
+            st.markdown(cached)
+            hits, misses = gateway.cache.stats().get(feature, (0, 0))
+            st.toast(f"♻️ Reaproveitado do cache: a conversa não mudou desde a última geração "
+                     f"({hits} reaproveitadas, {misses} geradas).")
+            return cached
+        # Já consultado acima: gera direto (e guarda no cache)
+        return st.write_stream(gateway.stream(feature, messages, refresh=True))
+    except Exception as e:
+        st.error(f"{error_message}: {str(e)}")
+        return None
+
+def generate_lead_status_summary(phone, email, monday_info, refresh=False):
+    """Gera um resumo do status do lead usando IA.
+
+    Se o item do Monday já tem um resumo com marca d'água, só as mensagens
+    e atualizações posteriores a ela são carregadas e vão para a IA, junto
+    com o resumo anterior; `refresh` refaz o resumo a partir de todo o
+    histórico. Retorna (resumo, marca d'água); a marca d'água é None quando
+    não há nada novo desde o último resumo, que é retornado como está.
+    """
     # Fetch Monday updates if we have an item ID
     monday_updates = []
+    previous_summary, previous_watermark = None, None
     if monday_info.get('item_id'):
         try:
             updates = fetch_monday_updates([monday_info['item_id']])
             if updates and len(updates) > 0:
-                monday_updates = updates[0].get('updates', [])
+                item_updates = updates[0].get('updates', [])
+                if not refresh:
+                    previous_summary, previous_watermark = last_summary(item_updates)
+                # Resumos gerados antes não entram: o novo resumo (e a chave
+                # dele no cache) depende só da conversa e das atualizações da equipe
+                monday_updates = [
+                    update for update in item_updates
+                    if SUMMARY_MARKER not in update.get('body', '')
+                ]
         except Exception as e:
             st.warning(f"Não foi possível buscar atualizações do Monday: {str(e)}")
     
+    # Only what happened after the previous summary, loaded page by page
+    # back to it (texts only for the messages that fit in the prompt)
+    messages = load_messages_since(phone, email, previous_watermark)
+    messages = messages.sort_values('created_at', ascending=True)
+    new_messages = messages_since(messages, previous_watermark)
+    monday_updates = updates_since(monday_updates, previous_watermark)
+    if previous_summary is not None and new_messages.empty and not monday_updates:
+        st.session_state['summary_context'] = (
+            f"Nenhuma mensagem nova desde o último resumo "
+            f"({previous_watermark.tz_convert('America/Sao_Paulo'):%d/%m/%Y %H:%M})."
+        )
+        st.markdown(previous_summary)
+        return previous_summary, None
+    watermark = (new_messages if not new_messages.empty else messages)['created_at'].max()
+    
+    # Prepare the conversation text, bounded by the feature's token budget
+    context = build_conversation(new_messages, FEATURE_BUDGETS['summary'], icons=True,
+                                 load_payloads=payload_loader(phone, email, messages))
+    st.session_state['summary_context'] = context.describe()
+    conversation_text = context.text
+    
     # Prepare Monday info text
     monday_text = f"""
     Dados do Monday:
@@ -173,19 +214,45 @@ def generate_lead_status_summary(messages, monday_info):
     
     # Add updates to Monday info if available
     if monday_updates:
+        # Mais recentes primeiro, até o orçamento de tokens das atualizações
+        update_lines = [
+            f"- {update.get('created_at', 'N/A')}: {truncate(str(update.get('body', 'N/A')), UPDATE_MAX_TOKENS, 'atualização')}"
+            for update in monday_updates
+        ]
+        update_lines, omitted = fit_lines(update_lines, UPDATES_BUDGET)
         monday_text += "\nAtualizações recentes:\n"
-        for update in monday_updates:
-            monday_text += f"- {update.get('created_at', 'N/A')}: {update.get('body', 'N/A')}\n"
+        monday_text += "".join(f"{line}\n" for line in update_lines)
+        if omitted:
+            monday_text += f"- ({omitted} atualizações mais antigas omitidas)\n"
     
     # Prepare the prompt for lead status summary
-    prompt = f"""Analise o histórico de conversas e os dados do Monday para gerar um resumo claro e objetivo do status do lead.
+    if previous_summary is not None:
+        st.session_state['summary_context'] = (
+            f"Resumo incremental: {len(new_messages)} mensagens novas desde "
+            f"{previous_watermark.tz_convert('America/Sao_Paulo'):%d/%m/%Y %H:%M}. "
+            + st.session_state['summary_context']
+        )
+        prompt = f"""Atualize o resumo do status do lead com as mensagens e os dados do Monday posteriores a ele.
+
+Resumo anterior:
+{truncate(previous_summary, PREVIOUS_SUMMARY_MAX_TOKENS, 'resumo')}
+
+Mensagens novas desde o resumo anterior:
+{conversation_text or "(nenhuma)"}
+
+{monday_text}
+
+Reescreva o resumo completo, incorporando o que mudou e mantendo do resumo anterior o que continua valendo. O resumo deve incluir:"""
+    else:
+        prompt = f"""Analise o histórico de conversas e os dados do Monday para gerar um resumo claro e objetivo do status do lead.
 
 Histórico de Conversas:
 {conversation_text}
 
 {monday_text}
 
-Por favor, forneça um resumo que inclua:
+Por favor, forneça um resumo que inclua:"""
+    prompt += """
 1. Situação atual do lead
 2. Principais pontos discutidos
 3. Próximos passos recomendados
@@ -194,38 +261,15 @@ Por favor, forneça um resumo que inclua:
 
 O resumo deve ser conciso e focado em informações relevantes para o acompanhamento do caso."""
     
-    # Call Grok API
-    url = "https://api.x.ai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {st.secrets.grok.api_key}",
-        "Content-Type": "application/json"
-    }
-    
     # Use custom prompt from session state if available
     system_prompt = st.session_state.get('summary_prompt', """Você é um assistente especializado em análise de leads jurídicos. 
 Sua função é gerar resumos claros e objetivos do status do lead, focando em informações relevantes para o acompanhamento do caso.""")
     
-    data = {
-        "model": "grok-3-latest",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.7,
-        "stream": False
-    }
-    
-    try:
-        with httpx.Client(verify=True, timeout=60.0) as client:
-            response = client.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            result = response.json()
-            return result['choices'][0]['message']['content']
-    except Exception as e:
-        st.error(f"Erro ao gerar resumo do lead: {str(e)}")
-        return None
+    # Call Grok API
+    summary = stream_completion('summary', system_prompt, prompt, "Erro ao gerar resumo do lead", refresh)
+    return summary, watermark
 
-def generate_suggestion(messages):
+def generate_suggestion(messages, load_payloads, refresh=False):
     """Gera uma sugestão de resposta baseada no histórico de mensagens."""
     # Sort messages in ascending order (oldest first)
     messages = messages.sort_values('created_at', ascending=True)
@@ -233,31 +277,10 @@ def generate_suggestion(messages):
     # Get the last message from the client
     last_client_message = messages[messages['message_direction'] == 'received'].iloc[-1]
     
-    # Prepare the conversation text
-    conversation = []
-    for _, msg in messages.iterrows():
-        role = "Cliente" if msg['message_direction'] == 'received' else "Atendente"
-        content = msg['message_text'] or ''
-        
-        # Add file information if present
-        if 'file_url' in msg and pd.notna(msg['file_url']):
-            content += f"\n[Anexo: {msg.get('attachment_filename', 'Arquivo')}]({msg['file_url']})"
-        
-        # Add attachment URL if present
-        if 'attachment_url' in msg and pd.notna(msg['attachment_url']):
-            content += f"\n[Anexo: {msg.get('attachment_filename', 'Arquivo')}]({msg['attachment_url']})"
-        
-        # Add OCR information if present
-        if 'ocr_scan' in msg and pd.notna(msg['ocr_scan']):
-            content += f"\nOCR: {msg['ocr_scan']}"
-        
-        # Add audio transcription if present
-        if 'audio_transcription' in msg and pd.notna(msg['audio_transcription']):
-            content += f"\nTranscrição: {msg['audio_transcription']}"
-        
-        conversation.append(f"{role}: {content}")
-    
-    conversation_text = "\n".join(conversation)
+    # Prepare the conversation text, bounded by the feature's token budget
+    context = build_conversation(messages, FEATURE_BUDGETS['suggestion'], load_payloads=load_payloads)
+    st.session_state['suggestion_context'] = context.describe()
+    conversation_text = context.text
     
     # Prepare the prompt for suggestion
     prompt = f"""Analise o histórico de conversas e a última mensagem do cliente para gerar uma sugestão de resposta.
@@ -265,17 +288,10 @@ def generate_suggestion(messages):
 Histórico de Conversas:
 {conversation_text}
 
-Última mensagem do cliente: {last_client_message['message_text']}
+Última mensagem do cliente: {truncate(text_or_empty(last_client_message['message_text']), TEXT_MAX_TOKENS)}
 
 Por favor, sugira uma resposta profissional e adequada."""
     
-    # Call Grok API
-    url = "https://api.x.ai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {st.secrets.grok.api_key}",
-        "Content-Type": "application/json"
-    }
-    
     # Use custom prompt from session state if available
     system_prompt = st.session_state.get('suggestion_prompt', """Você é um assistente especializado em sugestões de resposta para atendimento jurídico.
 Sua função é gerar sugestões de resposta profissionais e adequadas ao contexto.
@@ -283,56 +299,18 @@ Sua função é gerar sugestões de resposta profissionais e adequadas ao contex
 - Não adicione nenhum texto que não seria enviado para o cliente final.
 - Não assine as mensagens""")
     
-    data = {
-        "model": "grok-3-latest",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.7,
-        "stream": False
-    }
-    
-    try:
-        with httpx.Client(verify=True, timeout=60.0) as client:
-            response = client.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            result = response.json()
-            return result['choices'][0]['message']['content']
-    except Exception as e:
-        st.error(f"Erro ao gerar sugestão: {str(e)}")
-        return None
+    # Call Grok API
+    return stream_completion('suggestion', system_prompt, prompt, "Erro ao gerar sugestão", refresh)
 
-def generate_missing_documents(messages, system_prompt=None):
+def generate_missing_documents(messages, load_payloads, system_prompt=None, refresh=False):
     """Gera uma lista de documentos enviados e faltantes baseada no histórico de mensagens."""
     # Sort messages in ascending order (oldest first)
     messages = messages.sort_values('created_at', ascending=True)
     
-    # Prepare the conversation text
-    conversation = []
-    for _, msg in messages.iterrows():
-        role = "Cliente" if msg['message_direction'] == 'received' else "Atendente"
-        content = msg['message_text'] or ''
-        
-        # Add file information if present
-        if 'file_url' in msg and pd.notna(msg['file_url']):
-            content += f"\n[Anexo: {msg.get('attachment_filename', 'Arquivo')}]({msg['file_url']})"
-        
-        # Add attachment URL if present
-        if 'attachment_url' in msg and pd.notna(msg['attachment_url']):
-            content += f"\n[Anexo: {msg.get('attachment_filename', 'Arquivo')}]({msg['attachment_url']})"
-        
-        # Add OCR information if present
-        if 'ocr_scan' in msg and pd.notna(msg['ocr_scan']):
-            content += f"\nOCR: {msg['ocr_scan']}"
-        
-        # Add audio transcription if present
-        if 'audio_transcription' in msg and pd.notna(msg['audio_transcription']):
-            content += f"\nTranscrição: {msg['audio_transcription']}"
-        
-        conversation.append(f"{role}: {content}")
-    
-    conversation_text = "\n".join(conversation)
+    # Prepare the conversation text, bounded by the feature's token budget
+    context = build_conversation(messages, FEATURE_BUDGETS['documents'], load_payloads=load_payloads)
+    st.session_state['documents_context'] = context.describe()
+    conversation_text = context.text
     
     # Prepare the prompt for document analysis
     prompt = f"""Analise o histórico de conversas e identifique quais documentos foram enviados e quais ainda faltam.
@@ -347,75 +325,106 @@ Por favor, forneça uma lista organizada com:
 
 Formate a resposta em markdown para melhor visualização."""
     
-    # Call Grok API
-    url = "https://api.x.ai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {st.secrets.grok.api_key}",
-        "Content-Type": "application/json"
-    }
-    
     # Use custom prompt from session state if available
     if system_prompt is None:
         system_prompt = st.session_state.get('documents_prompt', """Você é um assistente especializado em análise de documentos jurídicos.
 Sua função é identificar quais documentos foram enviados e quais ainda faltam.""")
     
-    data = {
-        "model": "grok-3-latest",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.7,
-        "stream": False
-    }
-    
-    try:
-        with httpx.Client(verify=True, timeout=60.0) as client:
-            response = client.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            result = response.json()
-            return result['choices'][0]['message']['content']
-    except Exception as e:
-        st.error(f"Erro ao gerar lista de documentos: {str(e)}")
-        return None
+    # Call Grok API
+    return stream_completion('documents', system_prompt, prompt, "Erro ao gerar lista de documentos", refresh)
+
+# Grok client shared by all sessions, so generations reuse pooled connections,
+# with its answers cached on disk (ROSENBAUM_LLM_CACHE=off disables it)
+@st.cache_resource
+def get_llm_gateway():
+    path = os.environ.get('ROSENBAUM_LLM_CACHE', os.path.join(current_dir, '.cache', 'llm_outputs.sqlite'))
+    cache = None if path == 'off' else LLMCache(path)
+    return LLMGateway(st.secrets.grok.api_key, cache=cache)
+
+# Query backend (BigQuery or local DuckDB) shared by all sessions
+@st.cache_resource
+def get_query_backend():
+    return backend_from_env()
+
+# Lead list shared by all sessions of this process, refreshed incrementally
+# and persisted to a local snapshot for fast cold starts
+def lead_snapshot_path():
+    return os.environ.get(
+        'ROSENBAUM_SNAPSHOT_PATH',
+        os.path.join(current_dir, '.cache', f'leads-{get_query_backend().name}.arrow'),
+    )
 
-# Cache the data loading function
-@st.cache_data(ttl=300)  # Cache for 5 minutes
-def load_data():
-    query = read_sql_file(sql_file_path)
-    df = client.query(query).to_dataframe()
-    
-    # Convert last_message to São Paulo timezone (it comes in UTC)
-    if 'last_message' in df.columns:
-        df['last_message'] = pd.to_datetime(df['last_message'])
-        if df['last_message'].dt.tz is None:
-            df['last_message'] = df['last_message'].dt.tz_localize('UTC')
-        df['last_message'] = df['last_message'].dt.tz_convert('America/Sao_Paulo')
-    
-    # Ensure email column exists and is string type
-    if 'email' not in df.columns:
-        df['email'] = ''
+@st.cache_resource
+def get_lead_store():
+    backend = get_query_backend()
+    return LeadStore(
+        partial(backend.run_query, scope=LEADS_SCOPE),
+        read_sql_file(sql_file_path),
+        read_sql_file(sql_delta_file_path),
+        snapshot_path=lead_snapshot_path(),
+    )
+
+def load_leads():
+    """Return (version, frame) of the lead list without waiting for its periodic refresh.
+
+    A background thread keeps the list fresh (stale-while-revalidate); only
+    the very first load of a process without a snapshot waits on BigQuery.
+    """
+    store = get_lead_store()
+    if store.frame is None:
+        store.refresh()
+    store.start_refresher()
+    return store.current()
+
+# Filter index of the lead list, built once per data version
+@st.cache_resource(max_entries=2)
+def get_lead_index(version, _frame):
+    return LeadIndex(_frame)
+
+# Lead list served page by page by the query backend, for lists too large
+# to hold in every process
+@st.cache_resource
+def get_lead_query():
+    return LeadQuery(partial(get_query_backend().run_query, scope=LEADS_SCOPE))
+
+@st.cache_resource
+def get_lead_list_mode():
+    """'memory' or 'server' (see lead_query), decided once per process.
+
+    `auto` decides from the row count of the lead snapshot, so the first
+    render never waits on a count query; without a snapshot it starts in
+    memory, and the snapshot that load writes decides for later processes.
+    """
+    if os.environ.get('ROSENBAUM_LEAD_LIST', 'auto') != 'auto':
+        return list_mode()
+    return list_mode(snapshot_rows(lead_snapshot_path()))
+
+# Full-text index of the messages on local disk, fed in the background
+@st.cache_resource
+def get_message_search():
+    backend = get_query_backend()
+    search = MessageSearch(index_path(backend.name))
+    # Message batches are large and read once: keep them out of the result cache
+    search.start_updater(backend.uncached().run_query)
+    return search
+
+# Watermark of the message rollup (see lead_stats_job), read with the lead
+# list's scope and kept for 5 minutes: an older one is still correct
+@st.cache_resource(ttl=300)
+def get_settled_until():
+    return settled_watermark(partial(get_query_backend().run_query, scope=LEADS_SCOPE))
+
+def invalidate_leads():
+    """Reload the lead list from BigQuery now, bypassing the shared cache."""
+    get_query_backend().invalidate(LEADS_SCOPE)
+    get_settled_until.clear()
+    if get_lead_list_mode() == 'memory':
+        get_lead_store().refresh(force=True)
     else:
-        df['email'] = df['email'].fillna('').astype(str)
-    
-    # Add channel column based on email and phone
-    df['channel'] = 'whatsapp'  # default to whatsapp
-    df.loc[df['email'].str.len() > 0, 'channel'] = 'email'  # if email exists, set to email
-    
-    return df
+        get_lead_query().invalidate()
 
-# Function to load messages
-@st.cache_data(ttl=300)  # Cache for 5 minutes
-def load_messages(phone, email=None):
-    query = read_sql_file(messages_sql_path)
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("phone", "STRING", phone),
-            bigquery.ScalarQueryParameter("email", "STRING", email or "")
-        ]
-    )
-    df = client.query(query, job_config=job_config).to_dataframe()
-    
+def prepare_messages(df):
+    """Normalize the columns of a message history query result."""
     # Convert timestamps to São Paulo timezone
     if not df.empty:
         df['created_at'] = pd.to_datetime(df['created_at'])
@@ -424,13 +433,199 @@ def load_messages(phone, email=None):
         df['created_at'] = df['created_at'].dt.tz_convert('America/Sao_Paulo')
         
         # Ensure all columns are present
-        required_columns = ['created_at', 'message_text', 'attachment_url', 'audio_transcription', 'ocr_scan', 'message_direction', 'attachment_filename']
+        required_columns = ['created_at', 'message_text', 'attachment_url', 'has_audio', 'audio_size', 'has_ocr', 'ocr_size', 'message_direction', 'attachment_filename']
         for col in required_columns:
             if col not in df.columns:
                 df[col] = None
     
     return df
 
+# Message histories shared by all sessions of this process
+@st.cache_resource
+def get_message_cache():
+    return MessageCache(ttl=300)  # Cache for 5 minutes
+
+# Messages per page of a lead's history
+MESSAGE_PAGE_SIZE = 200
+
+# The message loaders below take the normalized keys from lead_keys(), so
+# every spelling of a lead's phone or email shares one cache entry
+
+def _query_message_page(backend, phone, email, cursor, page_size):
+    query = read_sql_file(messages_sql_path)
+    before_created_at, before_uid = cursor
+    return prepare_messages(backend.run_query(query, {
+        'phone': phone or "",
+        'email': email or "",
+        'before_created_at': before_created_at,
+        'before_uid': before_uid,
+        'page_size': page_size,
+        'settled_until': get_settled_until(),
+    }, scope=lead_scope(phone, email)))
+
+def load_message_history(phone, email=None):
+    """Return the pages of a lead's messages loaded so far (at least the first)."""
+    def load():
+        page = _query_message_page(get_query_backend(), phone, email, FIRST_PAGE_CURSOR, MESSAGE_PAGE_SIZE)
+        return MessageHistory.first_page(page, MESSAGE_PAGE_SIZE)
+    return get_message_cache().get_or_load(phone, email, load)
+
+# Function to load messages
+def load_messages(phone, email=None):
+    return load_message_history(phone, email).messages
+
+def load_older_messages(phone, email=None, page_size=MESSAGE_PAGE_SIZE):
+    """Fetch the next page of a lead's history and add it to the cache."""
+    history = load_message_history(phone, email)
+    if history.complete:
+        return history
+    page = _query_message_page(get_query_backend(), phone, email, history.cursor, page_size)
+    history = history.extend(page, page_size)
+    get_message_cache().put(phone, email, history)
+    return history
+
+def load_all_messages(phone, email=None):
+    """Return a lead's whole history, fetching every page not loaded yet."""
+    # One query for everything left instead of one per page
+    return load_older_messages(phone, email, page_size=2**62).messages
+
+def load_messages_since(phone, email, watermark):
+    """A lead's messages, loaded back far enough to hold those created after `watermark`.
+
+    Older pages are fetched only until one reaches the watermark; without
+    a watermark, the whole history is loaded.
+    """
+    if watermark is None:
+        return load_all_messages(phone, email)
+    history = load_message_history(phone, email)
+    while not history.complete and history.messages['created_at'].min() > watermark:
+        history = load_older_messages(phone, email)
+    return history.messages
+
+def invalidate_lead_messages(phone, email=None):
+    """Forget one lead's cached history, here and in the shared result cache."""
+    get_query_backend().invalidate(lead_scope(phone, email))
+    get_message_cache().invalidate(phone, email)
+
+# OCR and transcription texts, fetched only when shown or sent to the AI
+@st.cache_resource
+def get_payload_cache():
+    return PayloadCache()
+
+def has_flag(message, column):
+    """Whether a message row has a true `has_*` flag (missing counts as false)."""
+    value = message.get(column)
+    return value is not None and pd.notna(value) and bool(value)
+
+def size_label(label, message, column):
+    """Toggle label of an OCR or transcription, with its size when known.
+
+    Messages newer than the rollup's watermark come without sizes.
+    """
+    size = message.get(column)
+    if size is None or pd.isna(size):
+        return label
+    return f"{label} ({int(size):,} caracteres)"
+
+def created_range(messages_df):
+    """(first, last) created_at of a history, as UTC datetimes for query parameters."""
+    created_at = pd.to_datetime(messages_df['created_at'], utc=True)
+    return created_at.min().to_pydatetime(), created_at.max().to_pydatetime()
+
+def load_message_payloads(phone, email, message_uids, created_between):
+    """Return {message_uid: {'ocr_scan': ..., 'audio_transcription': ...}}.
+
+    `created_between` is the created_range() of the messages, which bounds
+    the scan of the messages table. Cached texts are reused; the missing
+    ones are fetched with one query.
+    """
+    cache = get_payload_cache()
+    payloads, missing = cache.get_many(message_uids)
+    if missing:
+        created_from, created_until = created_between
+        df = get_query_backend().run_query(read_sql_file(payloads_sql_path), {
+            'phone': phone or "",
+            'email': email or "",
+            'message_uids': sorted(missing),
+            'created_from': created_from,
+            'created_until': created_until,
+        })
+        fetched = {
+            row['message_uid']: {
+                'ocr_scan': text_or_empty(row['ocr_scan']) or None,
+                'audio_transcription': text_or_empty(row['audio_transcription']) or None,
+            }
+            for _, row in df.iterrows()
+        }
+        cache.put_many(fetched)
+        payloads.update(fetched)
+    return payloads
+
+def history_view(messages_df):
+    """What the history tab shows of a lead's messages, apart from widget state.
+
+    Returns the messages newest first, their response times and the
+    (message_uid, has_ocr, has_audio) flags of those with OCR or audio.
+    """
+    sorted_messages = messages_df.sort_values('created_at', ascending=False)
+    flags = {}
+    for column in ('has_ocr', 'has_audio'):
+        if column in sorted_messages.columns:
+            flags[column] = sorted_messages[column].fillna(False).astype(bool).to_numpy()
+        else:
+            flags[column] = np.zeros(len(sorted_messages), dtype=bool)
+    any_flag = flags['has_ocr'] | flags['has_audio']
+    flagged = list(zip(sorted_messages['message_uid'].to_numpy()[any_flag],
+                       flags['has_ocr'][any_flag], flags['has_audio'][any_flag]))
+    return sorted_messages, calculate_response_time(sorted_messages), flagged
+
+def payload_loader(phone, email, messages_df):
+    """`load_payloads` callback of build_conversation for a lead's history.
+
+    The prompt builders pick the messages that fit first, so only their
+    OCR and transcription texts are fetched.
+    """
+    created_between = created_range(messages_df)
+    return lambda message_uids: load_message_payloads(phone, email, message_uids, created_between)
+
+def load_messages_batch(backend, leads, settled_until):
+    """Load the first page of history of several leads with one query.
+
+    `leads` is a list of normalized (phone, email) pairs and `settled_until`
+    the watermark from get_settled_until(). Each lead gets the page that
+    load_message_history would load for it.
+    """
+    query = read_sql_file(messages_batch_sql_path)
+    df = backend.run_query(query, {
+        'phones': sorted({phone for phone, _ in leads if phone}),
+        'emails': sorted({email for _, email in leads if email}),
+        'page_size': MESSAGE_PAGE_SIZE,
+        'settled_until': settled_until,
+    }, scope=[lead_scope(phone, email) for phone, email in leads])
+    df = prepare_messages(df)
+    histories = {}
+    for phone, email in leads:
+        matches = (
+            ((df['key_type'] == 'phone') & (df['lead_key'] == phone))
+            | ((df['key_type'] == 'email') & (df['lead_key'] == email))
+        )
+        page = (
+            df[matches.fillna(False)]
+            .drop_duplicates('message_uid')
+            .drop(columns=['key_type', 'lead_key'])
+            .head(MESSAGE_PAGE_SIZE)
+        )
+        histories[(phone, email)] = MessageHistory.first_page(page, MESSAGE_PAGE_SIZE)
+    return histories
+
+def prefetch_messages(leads_df):
+    """Start loading, in the background, the histories of the listed leads."""
+    leads = [lead_keys(row['phone'], row['email']) for _, row in leads_df.iterrows()]
+    leads = [(phone, email) for phone, email in leads if phone or email]
+    backend = get_query_backend()
+    settled_until = get_settled_until()
+    get_message_cache().prefetch(leads, lambda batch: load_messages_batch(backend, batch, settled_until))
+
 # Function to show lead details
 def show_lead_details(lead_data):
     # Display title and back button
@@ -521,16 +716,19 @@ def show_lead_details(lead_data):
     st.markdown("---")
 
     # Load messages first to make them available for the suggestion feature
+    history = None
     try:
-        phone = lead_data.get('phone')
-        email = lead_data.get('email')
+        phone, email = lead_keys(lead_data.get('phone'), lead_data.get('email'))
         if phone or email:
             with st.spinner('Carregando mensagens...'):
-                messages_df = load_messages(phone, email)
+                history = load_message_history(phone, email)
+                messages_df = history.messages
                 if messages_df.empty:
                     st.warning("Nenhuma mensagem encontrada para este lead.")
-                else:
+                elif history.complete:
                     st.success(f"Carregadas {len(messages_df)} mensagens.")
+                else:
+                    st.success(f"Carregadas as {len(messages_df)} mensagens mais recentes.")
         else:
             messages_df = pd.DataFrame()
             st.warning("Número de telefone e email não disponíveis para este lead.")
@@ -555,6 +753,8 @@ def show_lead_details(lead_data):
             summary_container = st.empty()
             
             # Add button to generate summary
+            refresh_summary = st.checkbox("Forçar nova geração", key="refresh_summary",
+                                          help="Refaz o resumo a partir de todo o histórico, em vez de atualizar o último resumo com as mensagens novas.")
             if st.button("Gerar Resumo do Lead", use_container_width=True):
                 with st.spinner("Gerando resumo do lead..."):
                     monday_info = {
@@ -568,8 +768,13 @@ def show_lead_details(lead_data):
                     }
                     
                     if not messages_df.empty:
-                        summary = generate_lead_status_summary(messages_df, monday_info)
-                        if summary:
+                        # O resumo aparece no container à medida que é gerado
+                        with summary_container.expander("Resumo do Lead", expanded=True):
+                            summary, watermark = generate_lead_status_summary(phone, email, monday_info, refresh_summary)
+                        if summary and watermark is None:
+                            st.session_state.lead_summary = summary
+                            st.info("Nenhuma mensagem nova desde o último resumo: o resumo no Monday continua atual.")
+                        elif summary:
                             st.session_state.lead_summary = summary
                             
                             # Deletar resumos antigos e enviar o novo
@@ -582,7 +787,7 @@ def show_lead_details(lead_data):
                                     st.warning(f"Não foi possível deletar resumos antigos: {result}")
                                 
                                 # Depois, envia o novo resumo
-                                update_text = f"{summary}\n\n---\nGerado com Rosenbaum AI"
+                                update_text = format_summary_update(summary, watermark)
                                 success, result = send_monday_update(lead_data['id'], update_text)
                                 if success:
                                     st.success("Resumo gerado e enviado para o Monday com sucesso!")
@@ -597,6 +802,8 @@ def show_lead_details(lead_data):
             if st.session_state.lead_summary:
                 with summary_container.expander("Resumo do Lead", expanded=True):
                     st.markdown(st.session_state.lead_summary)
+                    if 'summary_context' in st.session_state:
+                        st.caption(st.session_state.summary_context)
             else:
                 with summary_container:
                     st.info("Clique no botão acima para gerar o resumo do lead.")
@@ -638,11 +845,18 @@ Sua função é gerar resumos claros e objetivos do status do lead, focando em i
         message_tab, prompt_tab = st.tabs(["💬 Mensagem", "⚙️ Configurar Prompt"])
         
         with message_tab:
+            refresh_suggestion = st.checkbox("Forçar nova geração", key="refresh_suggestion",
+                                             help="Gera de novo mesmo que a conversa não tenha mudado desde a última sugestão.")
             if st.button("Gerar Sugestão de Resposta", use_container_width=True, key="generate_suggestion_button"):
                 with st.spinner("Gerando sugestão de resposta..."):
                     if not messages_df.empty:
-                        suggestion = generate_suggestion(messages_df)
+                        # Mostra a sugestão enquanto é gerada; depois ela vai para o campo de mensagem
+                        suggestion_stream = st.empty()
+                        with suggestion_stream.container():
+                            all_messages = load_all_messages(phone, email)
+                            suggestion = generate_suggestion(all_messages, payload_loader(phone, email, all_messages), refresh_suggestion)
                         if suggestion:
+                            suggestion_stream.empty()
                             st.session_state.suggested_message = suggestion
                         else:
                             st.error("Não foi possível gerar uma sugestão de resposta.")
@@ -650,6 +864,8 @@ Sua função é gerar resumos claros e objetivos do status do lead, focando em i
                         st.error("Não há mensagens disponíveis para gerar sugestão.")
             
             # Campo de mensagem e exibição dos resultados
+            if 'suggested_message' in st.session_state and 'suggestion_context' in st.session_state:
+                st.caption(st.session_state.suggestion_context)
             message = st.text_area(
                 "Digite sua mensagem:", 
                 height=100,
@@ -663,12 +879,13 @@ Sua função é gerar resumos claros e objetivos do status do lead, focando em i
                 if not message:
                     st.error("Por favor, digite uma mensagem para enviar.")
                 else:
-                    phone = lead_data.get('phone')
-                    if not phone:
+                    # The number as Monday stores it; `phone` is the normalized lookup key
+                    raw_phone = lead_data.get('phone')
+                    if not raw_phone:
                         st.error("Número de telefone não disponível para este lead.")
                     else:
                         with st.spinner("Enviando mensagem..."):
-                            success, result = send_whatsapp_message(phone, message)
+                            success, result = send_whatsapp_message(raw_phone, message)
                             if success:
                                 st.success(result)
                                 # Adicionar mensagem ao histórico
@@ -677,7 +894,7 @@ Sua função é gerar resumos claros e objetivos do status do lead, focando em i
                                     "Atendente",
                                     "+5511988094449",
                                     "Cliente",
-                                    phone,
+                                    raw_phone,
                                     message
                                 )
                             else:
@@ -698,7 +915,8 @@ Sua função é gerar resumos claros e objetivos do status do lead, focando em i
             
             # Botão de atualizar dados do lead
             if st.button("🔄 Atualizar Dados do Lead", use_container_width=True, key="refresh_lead"):
-                st.cache_data.clear()
+                # Only this lead's messages: the next load is one page query
+                invalidate_lead_messages(phone, email)
                 for key in ['lead_summary', 'messages_df']:
                     if key in st.session_state:
                         del st.session_state[key]
@@ -751,11 +969,20 @@ Sua função é gerar sugestões de resposta profissionais e adequadas ao contex
         # Display message history after the message sending section
         st.markdown("### Histórico de Mensagens")
         if not messages_df.empty:
-            # Sort messages in descending order (newest first)
-            sorted_messages = messages_df.sort_values('created_at', ascending=False)
+            # Messages newest first, response times and OCR / audio flags,
+            # derived once per cached history rather than on every rerun
+            if history is not None and messages_df is history.messages:
+                sorted_messages, response_times, flagged = history.derive('view', history_view)
+            else:
+                sorted_messages, response_times, flagged = history_view(messages_df)
             
-            # Calculate response times
-            response_times = calculate_response_time(sorted_messages)
+            # Fetch, in one query, the OCR / transcription texts that are expanded
+            expanded = [
+                uid for uid, has_ocr, has_audio in flagged
+                if (has_ocr and st.session_state.get(f"ocr_{uid}"))
+                or (has_audio and st.session_state.get(f"audio_{uid}"))
+            ]
+            payloads = load_message_payloads(phone, email, expanded, created_range(messages_df)) if expanded else {}
             
             # Display messages
             current_date = None
@@ -782,7 +1009,7 @@ Sua função é gerar sugestões de resposta profissionais e adequadas ao contex
                 role = "user" if message['message_direction'] == 'received' else "assistant"
                 
                 # Clean message content
-                content = strip_html_tags(message['message_text'] or '')
+                content = strip_html_tags(text_or_empty(message['message_text']))
                 
                 # Display message
                 with st.chat_message(role):
@@ -817,8 +1044,10 @@ Sua função é gerar sugestões de resposta profissionais e adequadas ao contex
                     if 'attachment_url' in message and pd.notna(message['attachment_url']):
                         st.markdown(f"[Abrir anexo]({message['attachment_url']})")
                     
-                    # Display OCR information if present
-                    if 'ocr_scan' in message and pd.notna(message['ocr_scan']):
+                    # Display OCR information if present, loading it when expanded
+                    uid = message['message_uid']
+                    ocr_text = payloads.get(uid, {}).get('ocr_scan')
+                    if has_flag(message, 'has_ocr') and st.toggle(size_label("📄 OCR", message, 'ocr_size'), key=f"ocr_{uid}") and ocr_text:
                         st.markdown("""
                             <div style='
                                 background-color: #f0f2f6;
@@ -829,14 +1058,15 @@ Sua função é gerar sugestões de resposta profissionais e adequadas ao contex
                                 <div style='font-size: 16px; margin-bottom: 5px;'>📄 <strong>OCR</strong></div>
                                 <div style='font-size: 14px;'>{}</div>
                             </div>
-                        """.format(message['ocr_scan']), unsafe_allow_html=True)
+                        """.format(ocr_text), unsafe_allow_html=True)
                     
                     # Display attachment filename if present
                     if 'attachment_filename' in message and pd.notna(message['attachment_filename']):
                         st.markdown(f"**Anexo:** {message['attachment_filename']}")
                     
-                    # Display audio transcription if present
-                    if 'audio_transcription' in message and pd.notna(message['audio_transcription']):
+                    # Display audio transcription if present, loading it when expanded
+                    audio_text = payloads.get(uid, {}).get('audio_transcription')
+                    if has_flag(message, 'has_audio') and st.toggle(size_label("🎤 Transcrição", message, 'audio_size'), key=f"audio_{uid}") and audio_text:
                         st.markdown("""
                             <div style='
                                 background-color: #f0f2f6;
@@ -847,7 +1077,7 @@ Sua função é gerar sugestões de resposta profissionais e adequadas ao contex
                                 <div style='font-size: 16px; margin-bottom: 5px;'>🎤 <strong>Transcrição de Áudio</strong></div>
                                 <div style='font-size: 14px;'>{}</div>
                             </div>
-                        """.format(message['audio_transcription']), unsafe_allow_html=True)
+                        """.format(audio_text), unsafe_allow_html=True)
                     
                     # Display response time if available
                     if message['message_direction'] == 'received':
@@ -856,6 +1086,13 @@ Sua função é gerar sugestões de resposta profissionais e adequadas ao contex
                             st.caption(f"Tempo de resposta: {response_time}")
                         else:
                             st.caption("Aguardando resposta")
+
+            # Older messages are only fetched on demand
+            if history is not None and not history.complete:
+                if st.button("Carregar mensagens anteriores", use_container_width=True, key="load_older_messages"):
+                    with st.spinner("Carregando mensagens anteriores..."):
+                        load_older_messages(phone, email)
+                    st.rerun()
         else:
             st.info("Nenhuma mensagem encontrada para este lead.")
 
@@ -867,14 +1104,21 @@ Sua função é gerar sugestões de resposta profissionais e adequadas ao contex
         documents_tab, documents_prompt_tab = st.tabs(["📄 Lista de Documentos", "⚙️ Configurar Prompt"])
         
         with documents_tab:
+            refresh_documents = st.checkbox("Forçar nova geração", key="refresh_documents",
+                                            help="Gera de novo mesmo que a conversa não tenha mudado desde a última lista.")
             if st.button("Gerar Lista de Documentos Faltantes", use_container_width=True):
                 with st.spinner("Gerando lista de documentos..."):
                     if not messages_df.empty:
                         # Use prompt customizado se existir
                         documents_prompt = st.session_state.get('documents_prompt', """Você é um assistente especializado em análise de documentos jurídicos.
 Sua função é identificar quais documentos foram enviados e quais ainda faltam.""")
-                        checklist = generate_missing_documents(messages_df, documents_prompt)
+                        # Mostra a lista enquanto é gerada; depois ela é exibida abaixo
+                        checklist_stream = st.empty()
+                        with checklist_stream.container():
+                            all_messages = load_all_messages(phone, email)
+                            checklist = generate_missing_documents(all_messages, payload_loader(phone, email, all_messages), documents_prompt, refresh_documents)
                         if checklist:
+                            checklist_stream.empty()
                             st.session_state.documents_checklist = checklist
                         else:
                             st.error("Não foi possível gerar a lista de documentos.")
@@ -883,6 +1127,8 @@ Sua função é identificar quais documentos foram enviados e quais ainda faltam
             
             if 'documents_checklist' in st.session_state:
                 st.markdown(st.session_state.documents_checklist)
+                if 'documents_context' in st.session_state:
+                    st.caption(st.session_state.documents_context)
             else:
                 st.info("Clique no botão acima para gerar a lista de documentos faltantes.")
         
@@ -978,7 +1224,10 @@ Sua função é identificar quais documentos foram enviados e quais ainda faltam
                     st.markdown(prompt)
                 
                 # Prepare context for the AI
-                conversation_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in st.session_state.chat_history])
+                # Newest turns first, up to the chat's token budget
+                chat_lines = [f"{msg['role']}: {msg['content']}" for msg in reversed(st.session_state.chat_history)]
+                chat_lines, _ = fit_lines(chat_lines, FEATURE_BUDGETS['chat'])
+                conversation_text = "\n".join(reversed(chat_lines))
                 
                 # Prepare Monday info
                 monday_info = {
@@ -1010,40 +1259,16 @@ Pergunta do usuário: {prompt}
 Por favor, forneça uma resposta clara e objetiva baseada nas informações disponíveis."""
                 
                 # Call Grok API
-                url = "https://api.x.ai/v1/chat/completions"
-                headers = {
-                    "Authorization": f"Bearer {st.secrets.grok.api_key}",
-                    "Content-Type": "application/json"
-                }
-                
-                data = {
-                    "model": "grok-3-latest",
-                    "messages": [
-                        {"role": "system", "content": """Você é um assistente especializado em análise de leads jurídicos.
+                system_prompt = """Você é um assistente especializado em análise de leads jurídicos.
 Sua função é ajudar a entender melhor o contexto do lead e fornecer insights relevantes.
-Seja claro, objetivo e profissional em suas respostas."""},
-                        {"role": "user", "content": full_prompt}
-                    ],
-                    "temperature": 0.7,
-                    "stream": False
-                }
+Seja claro, objetivo e profissional em suas respostas."""
                 
-                try:
-                    with st.spinner("Pensando..."):
-                        with httpx.Client(verify=True, timeout=60.0) as client:
-                            response = client.post(url, headers=headers, json=data)
-                            response.raise_for_status()
-                            result = response.json()
-                            ai_response = result['choices'][0]['message']['content']
-                            
-                            # Add AI response to chat history
-                            st.session_state.chat_history.append({"role": "assistant", "content": ai_response})
-                            
-                            # Display AI response
-                            with st.chat_message("assistant"):
-                                st.markdown(ai_response)
-                except Exception as e:
-                    st.error(f"Erro ao gerar resposta: {str(e)}")
+                with st.chat_message("assistant"):
+                    ai_response = stream_completion('chat', system_prompt, full_prompt, "Erro ao gerar resposta")
+                
+                # Add AI response to chat history
+                if ai_response:
+                    st.session_state.chat_history.append({"role": "assistant", "content": ai_response})
 
             # Add clear chat button
             if st.button("🗑️ Limpar Chat", use_container_width=True, key="clear_chat_button"):
@@ -1288,13 +1513,37 @@ def delete_old_summaries(item_id):
     deleted_count = 0
     
     for update in updates:
-        if "Gerado com Rosenbaum AI" in update.get("body", ""):
+        if SUMMARY_MARKER in update.get("body", ""):
             success, _ = delete_monday_update(update["id"])
             if success:
                 deleted_count += 1
     
     return True, f"{deleted_count} resumos antigos deletados"
 
+def open_lead(row):
+    """Show the details of a lead list row on the next run."""
+    created_at_str = row['created_at'].strftime('%d/%m/%Y %H:%M') if pd.notna(row['created_at']) else ''
+    last_message_str = row['last_message'].strftime('%d/%m/%Y %H:%M') if pd.notna(row['last_message']) else ''
+    lead_data = {
+        'id': str(row['id']),
+        'created_at': created_at_str,
+        'board': str(row['board']),
+        'title': str(row['title']),
+        'phone': str(row['phone']) if pd.notna(row['phone']) else None,
+        'email': str(row['email']) if pd.notna(row['email']) else None,
+        'monday_link': str(row['monday_link']) if pd.notna(row['monday_link']) else None,
+        'last_message': last_message_str,
+        'message_count': int(row['message_count']),
+        'ocr_count': int(row['ocr_count']),
+        'audio_count': int(row['audio_count']),
+        'email_count': int(row['email_count'])
+    }
+    st.session_state.show_lead = True
+    st.session_state.selected_lead = lead_data
+    if 'lead_summary' in st.session_state:
+        del st.session_state.lead_summary
+    st.rerun()
+
 try:
     # Initialize session state
     if 'show_lead' not in st.session_state:
@@ -1312,17 +1561,26 @@ try:
         st.session_state.documents_prompt = prompts['documents_prompt']
         st.session_state.prompts_loaded = True
 
-    # Load data with cache
-    df = load_data()
+    # The list view reads from the in-memory index or page by page from the
+    # backend; both have the same methods
+    if get_lead_list_mode() == 'memory':
+        # Load data with cache
+        data_version, df = load_leads()
 
-    # Ensure required columns exist
-    required_columns = ['id', 'created_at', 'board', 'title', 'phone', 'email', 'monday_link', 'last_message', 'message_count', 'ocr_count', 'audio_count']
-    missing_columns = [col for col in required_columns if col not in df.columns]
+        # Ensure required columns exist
+        required_columns = ['id', 'created_at', 'board', 'title', 'phone', 'email', 'monday_link', 'last_message', 'message_count', 'ocr_count', 'audio_count']
+        missing_columns = [col for col in required_columns if col not in df.columns]
 
-    if missing_columns:
-        st.error(f"Colunas necessárias não encontradas no DataFrame: {missing_columns}")
-        st.write("Colunas disponíveis:", df.columns.tolist())
-        st.stop()
+        if missing_columns:
+            st.error(f"Colunas necessárias não encontradas no DataFrame: {missing_columns}")
+            st.write("Colunas disponíveis:", df.columns.tolist())
+            st.stop()
+
+        lead_list = get_lead_index(data_version, df)
+        data_age = get_lead_store().age()
+    else:
+        lead_list = get_lead_query()
+        data_age = None
 
     # Se um lead está selecionado, mostrar seus detalhes
     if st.session_state.show_lead and st.session_state.selected_lead:
@@ -1331,19 +1589,26 @@ try:
         # Display title
         st.title("Rosenbaum CRM")
         
+        # Age of the lead list being shown, refreshed in the background
+        if data_age is not None:
+            st.caption(f"Dados atualizados há {format_response_time(data_age)}")
+        
         # Após o título principal, antes dos filtros:
         if st.button("🔄 Atualizar Dados", use_container_width=True):
-            st.cache_data.clear()
+            # Only the lead list: cached message histories stay valid
+            with st.spinner("Atualizando dados..."):
+                invalidate_leads()
             for key in ['lead_summary', 'messages_df', 'selected_lead', 'show_lead', 'page']:
                 if key in st.session_state:
                     del st.session_state[key]
             st.rerun()
         
-        # Display metrics
-        total_leads = len(df)
-        leads_with_ocr = len(df[df['ocr_count'] > 0])
-        leads_with_email = len(df[df['email_count'] > 0])
-        leads_with_audio = len(df[df['audio_count'] > 0])
+        # Display metrics, computed once per data version
+        summary = lead_list.summary()
+        total_leads = summary['total']
+        leads_with_ocr = summary['with_ocr']
+        leads_with_email = summary['with_email']
+        leads_with_audio = summary['with_audio']
 
         # Create a container for metrics with custom styling
         st.markdown("""
@@ -1409,8 +1674,12 @@ try:
 
         with col1:
             # Board filter
-            boards = ['Todos'] + sorted(df['board'].unique().tolist())
-            selected_board = st.selectbox('Quadro', boards)
+            board_counts = {'Todos': summary['total'], **summary['board_counts']}
+            selected_board = st.selectbox(
+                'Quadro',
+                list(board_counts),
+                format_func=lambda board: f"{board} ({board_counts[board]:,})"
+            )
 
         with col2:
             # Email filter
@@ -1426,8 +1695,7 @@ try:
         
         with col5:
             # Creation date range filter
-            min_date = df['created_at'].min()
-            max_date = df['created_at'].max()
+            min_date, max_date = summary['created_range']
             creation_date_range = st.date_input(
                 'Data de criação do lead',
                 value=(min_date, max_date),
@@ -1437,8 +1705,7 @@ try:
         
         with col6:
             # Last message date range filter
-            min_last_msg = df['last_message'].min()
-            max_last_msg = df['last_message'].max()
+            min_last_msg, max_last_msg = summary['last_message_range']
             last_msg_date_range = st.date_input(
                 'Data da última mensagem',
                 value=(min_last_msg, max_last_msg),
@@ -1468,63 +1735,58 @@ try:
             }
             sort_by = st.selectbox('Ordenar por', list(sort_options.keys()), index=2)
         
+        # Full-text search over the messages of every lead
+        search_messages = st.text_input(
+            'Buscar nas mensagens',
+            '',
+            placeholder='Texto, OCR, transcrições de áudio ou nomes de anexos (ex.: carta do INSS)'
+        )
+        
         # Add spacing between filters and table
         st.markdown("---")
-        st.markdown("### Lista de Leads")
-        st.markdown("")
-        
-        # Apply filters
-        filtered_df = df.copy()
-        
-        # Filter by board
-        if selected_board != 'Todos':
-            filtered_df = filtered_df[filtered_df['board'] == selected_board]
-        
-        # Filter by email
-        if email_filter == 'Com Email':
-            filtered_df = filtered_df[filtered_df['email_count'] > 0]
-        elif email_filter == 'Sem Email':
-            filtered_df = filtered_df[filtered_df['email_count'] == 0]
         
-        # Filter by OCR
-        if ocr_filter == 'Com OCR':
-            filtered_df = filtered_df[filtered_df['ocr_count'] > 0]
-        elif ocr_filter == 'Sem OCR':
-            filtered_df = filtered_df[filtered_df['ocr_count'] == 0]
-        
-        # Filter by Audio
-        if audio_filter == 'Com Áudio':
-            filtered_df = filtered_df[filtered_df['audio_count'] > 0]
-        elif audio_filter == 'Sem Áudio':
-            filtered_df = filtered_df[filtered_df['audio_count'] == 0]
-        
-        # Antes dos filtros de data, garantir que as colunas estão em datetime (mesmo se já estiverem)
-        filtered_df['created_at'] = pd.to_datetime(filtered_df['created_at'], errors='coerce')
-        filtered_df['last_message'] = pd.to_datetime(filtered_df['last_message'], errors='coerce')
-
-        # Filter by creation date range
-        if len(creation_date_range) == 2:
-            start_date, end_date = creation_date_range
-            start_date_dt = pd.to_datetime(start_date)
-            end_date_dt = pd.to_datetime(end_date)
-            filtered_df = filtered_df[
-                (filtered_df['created_at'].dt.date >= start_date_dt.date()) &
-                (filtered_df['created_at'].dt.date <= end_date_dt.date())
-            ]
+        # Filters of the list, applied by the index or compiled into SQL
+        flag_filters = {'Todos': None, 'Com Email': True, 'Sem Email': False,
+                        'Com OCR': True, 'Sem OCR': False, 'Com Áudio': True, 'Sem Áudio': False}
+        filters = dict(
+            board=None if selected_board == 'Todos' else selected_board,
+            has_email=flag_filters[email_filter],
+            has_ocr=flag_filters[ocr_filter],
+            has_audio=flag_filters[audio_filter],
+            created=creation_date_range if len(creation_date_range) == 2 else None,
+            last_message=last_msg_date_range if len(last_msg_date_range) == 2 else None,
+            # Title search is plain text, accents ignored
+            title=search_title or None,
+        )
         
-        # Filter by last message date range
-        if len(last_msg_date_range) == 2:
-            start_date, end_date = last_msg_date_range
-            start_date_dt = pd.to_datetime(start_date)
-            end_date_dt = pd.to_datetime(end_date)
-            filtered_df = filtered_df[
-                (filtered_df['last_message'].dt.date >= start_date_dt.date()) &
-                (filtered_df['last_message'].dt.date <= end_date_dt.date())
-            ]
+        # Leads whose messages match the search, best match first
+        if search_messages:
+            message_search = get_message_search()
+            found = lead_list.search_leads(message_search.search(search_messages), **filters)
+            
+            st.markdown("### Resultados nas Mensagens")
+            indexed, indexed_until, behind = message_search.status()
+            if indexed_until is None:
+                st.warning("O índice de busca ainda não foi construído: rode `python message_search.py`.")
+            else:
+                until = pd.Timestamp(indexed_until).tz_convert('America/Sao_Paulo').strftime('%d/%m/%Y %H:%M')
+                st.caption(f"{indexed} mensagens indexadas, até {until}"
+                           + (" (índice em atualização; resultados podem estar incompletos)" if behind else ""))
+            if found.empty:
+                st.info("Nenhuma mensagem encontrada.")
+            for _, row in found.iterrows():
+                cols = st.columns([3, 2, 6, 1, 1])
+                cols[0].write(row['title'])
+                cols[1].write(row['board'])
+                cols[2].markdown(f"{row['snippet']}  \n{row['matched_at'].tz_convert('America/Sao_Paulo').strftime('%d/%m/%Y %H:%M')}")
+                cols[3].write(f"🔎 {row['matches']}")
+                with cols[4]:
+                    if st.button("Abrir", key=f"search_btn_{row['id']}"):
+                        open_lead(row)
+            st.markdown("---")
         
-        # Filter by title search
-        if search_title:
-            filtered_df = filtered_df[filtered_df['title'].str.contains(search_title, case=False)]
+        st.markdown("### Lista de Leads")
+        st.markdown("")
         
         # Apply sorting
         sort_field = sort_options[sort_by]
@@ -1533,76 +1795,43 @@ try:
             ascending = True
         else:
             ascending = False
-
-        filtered_df = filtered_df.sort_values(by=sort_field, ascending=ascending)
         
-        # Calculate items per page and total pages
-        items_per_page = 20
-        total_items = len(filtered_df)
-        total_pages = (total_items + items_per_page - 1) // items_per_page
-        
-        # Get current page items
+        # Get current page items and the number of matching leads
+        items_per_page = 100
         start_idx = st.session_state.page * items_per_page
-        end_idx = min(start_idx + items_per_page, total_items)
-        current_page_items = filtered_df.iloc[start_idx:end_idx]
-        
-        # Create a container for the table
-        table_container = st.container()
+        current_page_items, total_items = lead_list.select(
+            start_idx, start_idx + items_per_page, sort_field, ascending, **filters
+        )
+        end_idx = start_idx + len(current_page_items)
+        total_pages = (total_items + items_per_page - 1) // items_per_page
         
-        # Display the data in a table with buttons
-        with table_container:
-            # Create header row
-            header_cols = st.columns([1, 2, 2, 3, 2, 1, 1, 1, 1, 1])
-            header_cols[0].write("**ID**")
-            header_cols[1].write("**Data de Criação**")
-            header_cols[2].write("**Quadro**")
-            header_cols[3].write("**Título**")
-            header_cols[4].write("**Última Mensagem**")
-            header_cols[5].write("**Mensagens**")
-            header_cols[6].write("**OCR**")
-            header_cols[7].write("**Áudio**")
-            header_cols[8].write("**Emails**")
-            header_cols[9].write("**Ação**")
-            
-            st.markdown("---")
-            
-            # Display data rows
-            for _, row in current_page_items.iterrows():
-                cols = st.columns([1, 2, 2, 3, 2, 1, 1, 1, 1, 1])
-                cols[0].write(row['id'])
-                # Formatar datas apenas para exibição
-                created_at_str = row['created_at'].strftime('%d/%m/%Y %H:%M') if pd.notna(row['created_at']) else ''
-                last_message_str = row['last_message'].strftime('%d/%m/%Y %H:%M') if pd.notna(row['last_message']) else ''
-                cols[1].write(created_at_str)
-                cols[2].write(row['board'])
-                cols[3].write(row['title'])
-                cols[4].write(last_message_str)
-                cols[5].write(f"📨 {row['message_count']}")
-                cols[6].write(f"📄 {row['ocr_count']}")
-                cols[7].write(f"🎤 {row['audio_count']}")
-                cols[8].write(f"📧 {row['email_count']}")
-                with cols[9]:
-                    if st.button("Abrir", key=f"btn_{row['id']}"):
-                        lead_data = {
-                            'id': str(row['id']),
-                            'created_at': created_at_str,
-                            'board': str(row['board']),
-                            'title': str(row['title']),
-                            'phone': str(row['phone']) if pd.notna(row['phone']) else None,
-                            'email': str(row['email']) if pd.notna(row['email']) else None,
-                            'monday_link': str(row['monday_link']) if pd.notna(row['monday_link']) else None,
-                            'last_message': last_message_str,
-                            'message_count': int(row['message_count']),
-                            'ocr_count': int(row['ocr_count']),
-                            'audio_count': int(row['audio_count']),
-                            'email_count': int(row['email_count'])
-                        }
-                        st.session_state.show_lead = True
-                        st.session_state.selected_lead = lead_data
-                        if 'lead_summary' in st.session_state:
-                            del st.session_state.lead_summary
-                        st.rerun()
-                st.markdown("---")
+        # The page is a single table element: the browser virtualizes its
+        # rows, and selecting a row opens the lead
+        selection = st.dataframe(
+            current_page_items[['id', 'created_at', 'board', 'title', 'last_message',
+                                'message_count', 'ocr_count', 'audio_count', 'email_count']],
+            key='lead_table',
+            on_select='rerun',
+            selection_mode='single-row',
+            hide_index=True,
+            use_container_width=True,
+            height=600,
+            column_config={
+                'id': 'ID',
+                'created_at': st.column_config.DatetimeColumn('Data de Criação', format='DD/MM/YYYY HH:mm'),
+                'board': 'Quadro',
+                'title': st.column_config.TextColumn('Título', width='large'),
+                'last_message': st.column_config.DatetimeColumn('Última Mensagem', format='DD/MM/YYYY HH:mm'),
+                'message_count': st.column_config.NumberColumn('📨 Mensagens'),
+                'ocr_count': st.column_config.NumberColumn('📄 OCR'),
+                'audio_count': st.column_config.NumberColumn('🎤 Áudio'),
+                'email_count': st.column_config.NumberColumn('📧 Emails'),
+            },
+        )
+        # Read by key, not attribute: the selection may also be set through session state
+        selected_rows = selection['selection']['rows']
+        if selected_rows:
+            open_lead(current_page_items.iloc[selected_rows[0]])
         
         # Add pagination controls
         col1, col2, col3 = st.columns([1, 2, 1])
@@ -1615,6 +1844,9 @@ try:
             # Show current page info
             st.write(f"Mostrando {start_idx + 1}-{end_idx} de {total_items} itens")
 
+        # Load the message histories of the first rows while the user reads them
+        prefetch_messages(current_page_items.head(20))
+
 except Exception as e:
     st.error(f"Erro ao buscar dados: {str(e)}")
     st.info("Nenhum dado disponível") 
\ No newline at end of file
@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import pandas as pd
+
+# Cursor that sorts after every message, used to fetch the first page
+FIRST_PAGE_CURSOR = (datetime(9999, 12, 31, tzinfo=timezone.utc), '')
+
+
+def lead_key(phone, email):
+    """Cache key of a lead's message history."""
+    return (phone or '', email or '')
+
+
+def lead_scope(phone, email):
+    """Result cache scope of the queries about one lead's messages."""
+    return 'lead:' + '|'.join(lead_key(phone, email))
+
+
+class MessageHistory:
+    """The pages of a lead's messages loaded so far, newest first.
+
+    Pages are keyed on (created_at, message_uid): the next page holds the
+    messages strictly older than the last one loaded.
+
+    A history is shared by every session and never modified in place:
+    extend() returns a new one. Views derived from it are computed once
+    with derive() and reused by every rerun.
+    """
+
+    def __init__(self, messages, complete):
+        self.messages = messages
+        self.complete = complete
+        self._derived = {}
+
+    def derive(self, name, compute):
+        """Return `compute(messages)`, computed on first use for this history."""
+        if name not in self._derived:
+            # Racing sessions may both compute it; either result is kept
+            self._derived.setdefault(name, compute(self.messages))
+        return self._derived[name]
+
+    @classmethod
+    def first_page(cls, page, page_size):
+        return cls(page.reset_index(drop=True), len(page) < page_size)
+
+    @property
+    def cursor(self):
+        """Query parameters selecting the page after the loaded ones."""
+        if self.messages.empty:
+            return FIRST_PAGE_CURSOR
+        last = self.messages.iloc[-1]
+        return pd.Timestamp(last['created_at']).tz_convert('UTC').to_pydatetime(), last['message_uid']
+
+    def extend(self, page, page_size):
+        """Return a new history with an older page appended."""
+        messages = pd.concat([self.messages, page], ignore_index=True)
+        return MessageHistory(messages, len(page) < page_size)
+
+
+class MessageCache:
+    """Process-wide cache of message histories, keyed by lead.
+
+    Filled either on demand, one lead at a time, or in bulk by a background
+    prefetch of the leads visible on the list page.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._entries = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._prefetched = threading.Condition(self._lock)
+
+    def get(self, phone, email):
+        """Return the cached history of a lead, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(lead_key(phone, email))
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            return None
+        return entry[0]
+
+    def put(self, phone, email, messages):
+        with self._lock:
+            self._entries[lead_key(phone, email)] = (messages, time.monotonic())
+
+    def invalidate(self, phone, email):
+        """Forget the history of one lead."""
+        with self._lock:
+            self._entries.pop(lead_key(phone, email), None)
+
+    def get_or_load(self, phone, email, load, wait=10.0):
+        """Return the cached history of a lead, loading it with `load()` if needed.
+
+        If a prefetch for the lead is in flight, wait up to `wait` seconds for
+        it instead of issuing a second query.
+        """
+        key = lead_key(phone, email)
+        deadline = time.monotonic() + wait
+        with self._lock:
+            while key in self._pending and time.monotonic() < deadline:
+                self._prefetched.wait(deadline - time.monotonic())
+        messages = self.get(phone, email)
+        if messages is None:
+            messages = load()
+            self.put(phone, email, messages)
+        return messages
+
+    def prefetch(self, leads, load_batch):
+        """Load the histories of `leads` in a background thread.
+
+        `leads` is a list of (phone, email) pairs; those already cached or
+        being fetched are skipped. `load_batch(leads)` must return a dict
+        mapping each pair to its messages DataFrame.
+        """
+        with self._lock:
+            missing = []
+            for phone, email in leads:
+                key = lead_key(phone, email)
+                if key in self._pending or key in missing:
+                    continue
+                entry = self._entries.get(key)
+                if entry is None or time.monotonic() - entry[1] > self.ttl:
+                    missing.append(key)
+            self._pending.update(missing)
+        if not missing:
+            return None
+        thread = threading.Thread(target=self._prefetch, args=(missing, load_batch), daemon=True)
+        thread.start()
+        return thread
+
+    def _prefetch(self, leads, load_batch):
+        try:
+            for (phone, email), messages in load_batch(leads).items():
+                self.put(phone, email, messages)
+        except Exception as e:
+            print(f"Erro ao pré-carregar mensagens: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending.difference_update(leads)
+                self._prefetched.notify_all()
+
+
+class PayloadCache:
+    """LRU cache of the heavy per-message texts (OCR and transcription).
+
+    Keyed by message_uid; a message's texts never change, so entries only
+    leave the cache when it grows past `max_chars` characters.
+    """
+
+    def __init__(self, max_chars=50_000_000):
+        self.max_chars = max_chars
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _chars(payload):
+        return sum(len(text) for text in payload.values() if isinstance(text, str))
+
+    def get_many(self, message_uids):
+        """Return ({uid: payload} for the cached uids, [uids not cached])."""
+        found, missing = {}, []
+        with self._lock:
+            for uid in message_uids:
+                if uid in self._entries:
+                    self._entries.move_to_end(uid)
+                    found[uid] = self._entries[uid]
+                else:
+                    missing.append(uid)
+        return found, missing
+
+    def put_many(self, payloads):
+        with self._lock:
+            for uid, payload in payloads.items():
+                if uid in self._entries:
+                    self._size -= self._chars(self._entries.pop(uid))
+                self._entries[uid] = payload
+                self._size += self._chars(payload)
+            while self._size > self.max_chars and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= self._chars(evicted)
@@ -0,0 +1,321 @@
+"""Full-text search over message texts, OCR scans, transcriptions and file names.
+
+Messages are copied from `gtms.messages` into a local SQLite FTS5 index,
+incrementally: each update reads the messages created after the stored
+watermark (message_search_delta.sql) in batches. A search is then answered
+from the local file in milliseconds, ranked by BM25, with accents and case
+ignored, instead of by LIKE scans over the whole messages table.
+
+Building the index reads every message, texts included, so it is done
+once, offline, with large batches. By default it writes the file the app
+opens (index_path(), next to this script, named after the backend); keep it
+fed from a scheduled job the same way:
+
+    python message_search.py
+    python message_search.py --local fixtures/
+    python message_search.py --path /shared/message_search.sqlite
+
+The app's background thread only feeds an index that was built: each run
+reads at most MAX_BATCHES_PER_UPDATE batches past the watermark and resumes
+from there on the next one. Until the index is built, search reports so.
+
+The normalization UDFs of contact_keys_setup.sql must exist (lead_stats_job
+creates them).
+"""
+import argparse
+import os
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from query_backend import read_query
+from sqlite_store import SQLiteStore
+
+# Messages can land in the warehouse shortly after their created_at, so every
+# update re-reads this window; re-read messages just replace themselves.
+DELTA_LOOKBACK = timedelta(minutes=10)
+
+# Messages read per query while feeding the index, and per query of the
+# offline build
+BATCH_SIZE = 5000
+BACKFILL_BATCH_SIZE = 100_000
+
+# Batches one update of the app reads at most; a lagging index catches up
+# over several runs instead of in one long scan per process
+MAX_BATCHES_PER_UPDATE = 20
+
+# How often the background updater looks for new messages
+UPDATE_INTERVAL = timedelta(minutes=5)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    message_uid TEXT NOT NULL UNIQUE,
+    created_at TEXT NOT NULL,
+    phone_key TEXT,
+    email_key TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+    message_text,
+    ocr_scan,
+    audio_transcription,
+    attachment_filename,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS state (
+    watermark TEXT
+);
+INSERT INTO state (watermark)
+SELECT NULL WHERE NOT EXISTS (SELECT 1 FROM state);
+"""
+
+_TEXT_COLUMNS = ['message_text', 'ocr_scan', 'audio_transcription', 'attachment_filename']
+
+_WORD = re.compile(r'\w')
+
+
+def index_path(backend_name):
+    """SQLite file of the index the app opens for a backend ('bigquery', 'duckdb').
+
+    ROSENBAUM_MESSAGE_SEARCH_PATH overrides it, in the app and in main().
+    """
+    return os.environ.get(
+        'ROSENBAUM_MESSAGE_SEARCH_PATH',
+        os.path.join(_DIR, '.cache', f'message_search-{backend_name}.sqlite'),
+    )
+
+
+def match_expression(query):
+    """FTS5 expression of a plain-text search: every term, as a prefix.
+
+    Each whitespace-separated term is quoted, so punctuation inside it
+    (`0001234-56.2023`) matches the same sequence of tokens in a message.
+    """
+    terms = [term for term in query.split() if _WORD.search(term)]
+    return ' '.join('"' + term.replace('"', '""') + '"*' for term in terms)
+
+
+def _utc_text(values):
+    """ISO text of timestamps in UTC, which sorts like the timestamps."""
+    values = pd.to_datetime(values, utc=True)
+    return values.dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def rank_leads(hits, leads, contacts, mask=None, limit=20):
+    """Rows of `leads` owning search hits, best-ranked lead first.
+
+    `hits` is a search() result and `contacts` the (phone, email) position
+    maps of contact_keys.contact_positions(leads). Like the message history,
+    a lead owns the messages of its phone and of its email. Only leads
+    where `mask` is set are kept. The rows get the number of hits
+    (`matches`) and the snippet and date of their best hit (`snippet`,
+    `matched_at`).
+    """
+    phone_positions, email_positions = contacts
+    found = {}
+    for hit in hits.itertuples(index=False):
+        positions = set(phone_positions.get(hit.phone_key, ()))
+        positions.update(email_positions.get(hit.email_key, ()))
+        for position in positions:
+            if mask is not None and not mask[position]:
+                continue
+            if position in found:
+                found[position]['matches'] += 1
+            else:
+                found[position] = {'matches': 1, 'snippet': hit.snippet, 'matched_at': hit.created_at}
+    positions = list(found)[:limit]
+    rows = leads.take(positions).reset_index(drop=True)
+    best = pd.DataFrame([found[position] for position in positions],
+                        columns=['matches', 'snippet', 'matched_at'])
+    return pd.concat([rows, best], axis=1)
+
+
+class MessageSearch(SQLiteStore):
+    """SQLite FTS5 index of the messages, stored at `path`.
+
+    Several processes can share the file: SQLite serializes the writers, and
+    feeding the same messages twice only replaces them.
+    """
+
+    def __init__(self, path):
+        super().__init__(path, _SCHEMA)
+        self.updated_at = None
+        # Whether the last update stopped at its batch limit
+        self.behind = False
+        self._lock = threading.Lock()
+        self._updater = None
+        self._updater_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def watermark(self):
+        """created_at of the newest indexed message, or None if empty."""
+        with self._connect() as con:
+            row = con.execute('SELECT watermark FROM state').fetchone()
+        if row[0] is None:
+            return None
+        return pd.Timestamp(row[0]).to_pydatetime()
+
+    def __len__(self):
+        with self._connect() as con:
+            return con.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+
+    def status(self):
+        """(messages indexed, watermark, behind) of the index, for the UI.
+
+        `watermark` is None until the index is built; `behind` is set while
+        this process's updates are still catching up with the messages.
+        """
+        return len(self), self.watermark(), self.behind
+
+    def _add(self, batch):
+        created_at = _utc_text(batch['created_at'])
+        batch = batch.astype(object).where(batch.notna(), None)
+        uids = batch['message_uid'].tolist()
+        texts = batch[_TEXT_COLUMNS].itertuples(index=False, name=None)
+        with self._write() as con:
+            # Re-read messages replace their previous text
+            con.executemany(
+                'DELETE FROM message_fts WHERE rowid = (SELECT id FROM messages WHERE message_uid = ?)',
+                ((uid,) for uid in uids),
+            )
+            con.executemany(
+                'INSERT INTO messages (message_uid, created_at, phone_key, email_key) '
+                'VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (message_uid) DO UPDATE SET created_at = excluded.created_at, '
+                'phone_key = excluded.phone_key, email_key = excluded.email_key',
+                zip(uids, created_at, batch['phone_key'], batch['email_key']),
+            )
+            con.executemany(
+                'INSERT INTO message_fts (rowid, message_text, ocr_scan, audio_transcription, '
+                'attachment_filename) SELECT id, ?, ?, ?, ? FROM messages WHERE message_uid = ?',
+                (text + (uid,) for text, uid in zip(texts, uids)),
+            )
+            newest = created_at.max()
+            con.execute('UPDATE state SET watermark = ? WHERE watermark IS NULL OR watermark < ?',
+                        (newest, newest))
+
+    def update(self, run_query, batch_size=BATCH_SIZE, max_batches=MAX_BATCHES_PER_UPDATE,
+               backfill=False):
+        """Index the messages created since the watermark; returns how many were read.
+
+        Reads at most `max_batches` batches (None for no limit); the next
+        update resumes from the watermark. An empty index is only filled
+        with `backfill`, which reads the whole messages table.
+
+        Single-flight within a process: a caller that waited for an update
+        already running does not start another one.
+        """
+        started = datetime.now(timezone.utc)
+        with self._lock:
+            if self.updated_at is not None and self.updated_at >= started:
+                return 0
+            watermark = self.watermark()
+            if watermark is None and not backfill:
+                return 0
+            sql = read_query('message_search_delta.sql')
+            after_created_at = watermark - DELTA_LOOKBACK if watermark else _EPOCH
+            after_uid = ''
+            total = 0
+            batches = 0
+            self.behind = False
+            while True:
+                batch = run_query(sql, {
+                    'after_created_at': after_created_at,
+                    'after_uid': after_uid,
+                    'batch_size': batch_size,
+                })
+                if batch.empty:
+                    break
+                self._add(batch)
+                total += len(batch)
+                last = batch.iloc[-1]
+                after_created_at = pd.Timestamp(last['created_at']).to_pydatetime()
+                after_uid = last['message_uid']
+                batches += 1
+                if len(batch) < batch_size:
+                    break
+                if max_batches is not None and batches >= max_batches:
+                    self.behind = True
+                    break
+            self.updated_at = datetime.now(timezone.utc)
+            return total
+
+    def search(self, query, limit=500):
+        """Best `limit` messages matching every term of `query`, best first.
+
+        Returns message_uid, created_at, phone_key, email_key and a snippet
+        of the matching text with the terms in bold (Markdown).
+        """
+        columns = ['message_uid', 'created_at', 'phone_key', 'email_key', 'snippet']
+        expression = match_expression(query)
+        if not expression:
+            return pd.DataFrame(columns=columns)
+        with self._connect() as con:
+            rows = con.execute(
+                "SELECT m.message_uid, m.created_at, m.phone_key, m.email_key, "
+                "snippet(message_fts, -1, '**', '**', '…', 16) "
+                "FROM message_fts JOIN messages m ON m.id = message_fts.rowid "
+                "WHERE message_fts MATCH ? ORDER BY rank LIMIT ?",
+                (expression, limit),
+            ).fetchall()
+        hits = pd.DataFrame(rows, columns=columns)
+        hits['created_at'] = pd.to_datetime(hits['created_at'], utc=True)
+        return hits
+
+    def _background_update(self, run_query):
+        try:
+            self.update(run_query)
+        except Exception as e:
+            print(f"Erro ao atualizar índice de mensagens: {str(e)}")
+
+    def start_updater(self, run_query):
+        """Start the daemon thread feeding new messages every UPDATE_INTERVAL."""
+        with self._updater_lock:
+            if self._updater is not None and self._updater.is_alive():
+                return
+            self._stop.clear()
+            self._updater = threading.Thread(target=self._update_loop, args=(run_query,), daemon=True)
+            self._updater.start()
+
+    def stop_updater(self):
+        self._stop.set()
+
+    def _update_loop(self, run_query):
+        self._background_update(run_query)
+        while not self._stop.wait(UPDATE_INTERVAL.total_seconds()):
+            self._background_update(run_query)
+
+
+def main():
+    from query_backend import BigQueryBackend, DuckDBBackend
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--path',
+                        help="SQLite file of the index (default: the app's, see index_path)")
+    parser.add_argument('--local', metavar='FIXTURES',
+                        help='read the messages from Parquet fixtures on DuckDB')
+    parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE,
+                        help='messages read per query')
+    parser.add_argument('--max-batches', type=int,
+                        help='stop after this many batches (resume with another run)')
+    args = parser.parse_args()
+
+    if args.local:
+        backend = DuckDBBackend(fixtures_dir=args.local)
+        backend.run_script(read_query('contact_keys_setup.sql'))
+    else:
+        backend = BigQueryBackend()
+    index = MessageSearch(args.path or index_path(backend.name))
+    added = index.update(backend.run_query, batch_size=args.batch_size,
+                         max_batches=args.max_batches, backfill=True)
+    print(f"{added} mensagens lidas, {len(index)} no índice (até {index.watermark()})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+-- Messages matched per lead on the raw phone/email strings versus on the
+-- normalized keys, summarized over all leads. Needs an up-to-date rollup.
+with
+
+raw_phone as (
+    select chat_phone lead_key, count(*) message_count
+    from `zapy-306602.gtms.messages`
+    where chat_phone is not null
+    group by all
+),
+
+raw_email as (
+    select account_email lead_key, count(*) message_count
+    from `zapy-306602.gtms.messages`
+    where account_email is not null
+    group by all
+),
+
+phone_stats as (
+    select *
+    from `zapy-306602.gtms.lead_message_stats`
+    where key_type = 'phone'
+),
+
+email_stats as (
+    select *
+    from `zapy-306602.gtms.lead_message_stats`
+    where key_type = 'email'
+),
+
+matches as (
+    select
+        a.id,
+        coalesce(rp.message_count, 0) + coalesce(re.message_count, 0) as raw_matches,
+        coalesce(np.message_count, 0) + coalesce(ne.message_count, 0) as normalized_matches
+    from `zapy-306602.dbt.monday_sessions` a
+    left join raw_phone rp on a.phone = rp.lead_key
+    left join raw_email re on a.email = re.lead_key
+    left join phone_stats np on `zapy-306602.gtms.normalize_phone`(a.phone) = np.lead_key
+    left join email_stats ne on `zapy-306602.gtms.normalize_email`(a.email) = ne.lead_key
+)
+
+SELECT
+    count(*) as leads,
+    sum(case when normalized_matches > raw_matches then 1 else 0 end) as leads_gained,
+    sum(case when normalized_matches < raw_matches then 1 else 0 end) as leads_lost,
+    sum(case when raw_matches = 0 and normalized_matches > 0 then 1 else 0 end) as leads_found,
+    sum(raw_matches) as raw_messages,
+    sum(normalized_matches) as normalized_messages
+FROM matches
@@ -0,0 +1,19 @@
+-- Normalized lead keys, the same rules as contact_keys.py
+
+-- E.164 phone: national numbers get +55, 8-digit mobiles get their 9th digit
+CREATE OR REPLACE FUNCTION `zapy-306602.gtms.normalize_phone`(raw STRING) AS ((
+    SELECT CASE
+        WHEN d IS NULL OR d = '' THEN NULL
+        WHEN LENGTH(d) = 12 AND STARTS_WITH(d, '55') AND SUBSTR(d, 5, 1) IN ('6', '7', '8', '9')
+            THEN '+' || SUBSTR(d, 1, 4) || '9' || SUBSTR(d, 5)
+        ELSE '+' || d
+    END
+    FROM (
+        SELECT CASE WHEN LENGTH(n) IN (10, 11) THEN '55' || n ELSE n END AS d
+        FROM (SELECT LTRIM(REGEXP_REPLACE(raw, r'[^0-9]', ''), '0') AS n)
+    )
+));
+
+CREATE OR REPLACE FUNCTION `zapy-306602.gtms.normalize_email`(raw STRING) AS (
+    NULLIF(LOWER(TRIM(raw)), '')
+);
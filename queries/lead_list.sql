@@ -0,0 +1,32 @@
+-- The lead list as a relation, with the columns of monday_sessions.sql. The
+-- server-side list mode (lead_query.py) filters, sorts and pages it.
+with
+
+phone_stats as (
+    select *
+    from `zapy-306602.gtms.lead_message_stats`
+    where key_type = 'phone'
+),
+
+email_stats as (
+    select *
+    from `zapy-306602.gtms.lead_message_stats`
+    where key_type = 'email'
+)
+
+SELECT
+    a.id,
+    cast(a.created_at as timestamp) as created_at,
+    a.board,
+    a.title,
+    a.phone,
+    COALESCE(a.email, '') as email,
+    a.monday_link,
+    b.last_message,
+    b.message_count,
+    COALESCE(b.ocr_count, c.ocr_count, 0) as ocr_count,
+    COALESCE(b.audio_count, 0) as audio_count,
+    COALESCE(c.email_count, 0) as email_count
+FROM `zapy-306602.dbt.monday_sessions` a
+left join phone_stats b on `zapy-306602.gtms.normalize_phone`(a.phone) = b.lead_key
+left join email_stats c on `zapy-306602.gtms.normalize_email`(a.email) = c.lead_key
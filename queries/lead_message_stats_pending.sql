@@ -0,0 +1,11 @@
+-- Window of the next incremental update: from the watermark (messages created
+-- before it are settled) to the newest message; until is NULL when the
+-- window is empty
+SELECT
+    s.watermark as since,
+    (
+        SELECT max(created_at)
+        FROM `zapy-306602.gtms.messages`
+        WHERE created_at > s.watermark
+    ) as until
+FROM (SELECT max(watermark) as watermark FROM `zapy-306602.gtms.lead_message_stats_state`) s
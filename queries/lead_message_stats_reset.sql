@@ -0,0 +1,12 @@
+-- Empty the rollup and the keyed messages so the next update rebuilds them
+BEGIN TRANSACTION;
+
+DELETE FROM `zapy-306602.gtms.lead_message_stats` WHERE true;
+
+DELETE FROM `zapy-306602.gtms.messages_by_lead` WHERE true;
+
+UPDATE `zapy-306602.gtms.lead_message_stats_state`
+SET watermark = TIMESTAMP '1970-01-01 00:00:00+00'
+WHERE true;
+
+COMMIT TRANSACTION;
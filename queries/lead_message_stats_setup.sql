@@ -0,0 +1,52 @@
+CREATE TABLE IF NOT EXISTS `zapy-306602.gtms.lead_message_stats` (
+    key_type STRING,
+    lead_key STRING,
+    last_message TIMESTAMP,
+    message_count INT64,
+    ocr_count INT64,
+    audio_count INT64,
+    email_count INT64
+)
+CLUSTER BY key_type, lead_key;
+
+-- Messages under their normalized lead keys, one row per key: a message with
+-- both a phone and an email is stored twice. Lead lookups are point lookups
+-- on the clustering columns. The OCR scans and transcriptions stay in
+-- gtms.messages (message_payloads.sql reads them); whether a message has
+-- them, and their sizes, are stored so that reading a history or counting
+-- them never scans the texts.
+CREATE TABLE IF NOT EXISTS `zapy-306602.gtms.messages_by_lead` (
+    key_type STRING,
+    lead_key STRING,
+    phone_key STRING,
+    message_uid STRING,
+    created_at TIMESTAMP,
+    channel STRING,
+    message_text STRING,
+    file_url STRING,
+    message_direction STRING,
+    attachment_filename STRING,
+    has_ocr BOOL,
+    ocr_size INT64,
+    has_audio BOOL,
+    audio_size INT64
+)
+CLUSTER BY key_type, lead_key;
+
+-- Tables created before the size columns existed, or with the texts; their
+-- rows get the sizes from a run with --rebuild
+ALTER TABLE `zapy-306602.gtms.messages_by_lead` ADD COLUMN IF NOT EXISTS has_ocr BOOL;
+ALTER TABLE `zapy-306602.gtms.messages_by_lead` ADD COLUMN IF NOT EXISTS ocr_size INT64;
+ALTER TABLE `zapy-306602.gtms.messages_by_lead` ADD COLUMN IF NOT EXISTS has_audio BOOL;
+ALTER TABLE `zapy-306602.gtms.messages_by_lead` ADD COLUMN IF NOT EXISTS audio_size INT64;
+ALTER TABLE `zapy-306602.gtms.messages_by_lead` DROP COLUMN IF EXISTS ocr_scan;
+ALTER TABLE `zapy-306602.gtms.messages_by_lead` DROP COLUMN IF EXISTS audio_transcription;
+
+CREATE TABLE IF NOT EXISTS `zapy-306602.gtms.lead_message_stats_state` (
+    watermark TIMESTAMP
+);
+
+INSERT INTO `zapy-306602.gtms.lead_message_stats_state` (watermark)
+SELECT TIMESTAMP '1970-01-01 00:00:00+00'
+FROM (SELECT 1)
+WHERE NOT EXISTS (SELECT 1 FROM `zapy-306602.gtms.lead_message_stats_state`);
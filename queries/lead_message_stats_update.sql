@@ -0,0 +1,85 @@
+-- Replace everything stored for the messages created in (@since, @until].
+-- The window reaches back before the newest message of the previous run, so
+-- messages that landed late are picked up; the keyed rows of the window are
+-- deleted and inserted again, and the counts of the keys it touches are
+-- recomputed, so a message read by two runs is still counted once.
+BEGIN TRANSACTION;
+
+DELETE FROM `zapy-306602.gtms.messages_by_lead`
+WHERE created_at > @since AND created_at <= @until;
+
+INSERT INTO `zapy-306602.gtms.messages_by_lead` (
+    key_type, lead_key, phone_key, message_uid, created_at, channel, message_text,
+    file_url, message_direction, attachment_filename,
+    has_ocr, ocr_size, has_audio, audio_size
+)
+with
+
+window_messages as (
+    select
+        *,
+        `zapy-306602.gtms.normalize_phone`(chat_phone) as phone_key,
+        `zapy-306602.gtms.normalize_email`(account_email) as email_key,
+        ocr_scan is not null as has_ocr,
+        length(ocr_scan) as ocr_size,
+        audio_transcription is not null as has_audio,
+        length(audio_transcription) as audio_size
+    from `zapy-306602.gtms.messages`
+    where created_at > @since
+        and created_at <= @until
+)
+
+select
+    'phone', phone_key, phone_key, message_uid, created_at, channel, message_text,
+    file_url, message_direction, attachment_filename,
+    has_ocr, ocr_size, has_audio, audio_size
+from window_messages
+where phone_key is not null
+
+union all
+
+select
+    'email', email_key, phone_key, message_uid, created_at, channel, message_text,
+    file_url, message_direction, attachment_filename,
+    has_ocr, ocr_size, has_audio, audio_size
+from window_messages
+where email_key is not null;
+
+MERGE INTO `zapy-306602.gtms.lead_message_stats` t
+USING (
+    with
+
+    touched_keys as (
+        select distinct key_type, lead_key
+        from `zapy-306602.gtms.messages_by_lead`
+        where created_at > @since
+            and created_at <= @until
+    )
+
+    select
+        key_type,
+        lead_key,
+        max(m.created_at) last_message,
+        count(*) message_count,
+        count(case when m.has_ocr then 1 end) as ocr_count,
+        count(case when m.has_audio then 1 end) as audio_count,
+        count(case when m.channel = 'email' then 1 end) as email_count
+    from `zapy-306602.gtms.messages_by_lead` m
+    join touched_keys using (key_type, lead_key)
+    group by all
+) s
+ON t.key_type = s.key_type AND t.lead_key = s.lead_key
+WHEN MATCHED THEN UPDATE SET
+    last_message = s.last_message,
+    message_count = s.message_count,
+    ocr_count = s.ocr_count,
+    audio_count = s.audio_count,
+    email_count = s.email_count
+WHEN NOT MATCHED THEN INSERT (key_type, lead_key, last_message, message_count, ocr_count, audio_count, email_count)
+    VALUES (s.key_type, s.lead_key, s.last_message, s.message_count, s.ocr_count, s.audio_count, s.email_count);
+
+UPDATE `zapy-306602.gtms.lead_message_stats_state`
+SET watermark = GREATEST(watermark, @settled)
+WHERE true;
+
+COMMIT TRANSACTION;
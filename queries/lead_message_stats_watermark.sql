@@ -0,0 +1,4 @@
+-- Watermark of the rollup: messages_by_lead holds every message created up
+-- to it; NULL before the first run
+SELECT max(watermark) as watermark
+FROM `zapy-306602.gtms.lead_message_stats_state`
@@ -1,17 +1,76 @@
+-- A lead's messages up to @settled_until, the watermark of the rollup, are
+-- point lookups on its normalized keys (see contact_keys.py) in
+-- messages_by_lead; the newer ones, which lead_stats_job has not settled
+-- yet, are read from gtms.messages itself, so a history is never older than
+-- the messages table. A message found under both the phone and the email is
+-- kept once. @settled_until is a parameter rather than a subquery so that
+-- BigQuery prunes the scan of gtms.messages to the recent partitions.
+with
+
+recent_messages as (
+    SELECT
+        *,
+        `zapy-306602.gtms.normalize_phone`(chat_phone) as phone_key,
+        `zapy-306602.gtms.normalize_email`(account_email) as email_key
+    FROM `zapy-306602.gtms.messages`
+    WHERE created_at > @settled_until
+),
+
+lead_messages as (
+    SELECT
+        message_uid, created_at, channel, message_text, file_url, message_direction,
+        attachment_filename, has_audio, audio_size, has_ocr, ocr_size
+    FROM `zapy-306602.gtms.messages_by_lead`
+    WHERE key_type = 'phone' AND lead_key = @phone
+        AND created_at <= @settled_until
+
+    UNION ALL
+
+    SELECT
+        message_uid, created_at, channel, message_text, file_url, message_direction,
+        attachment_filename, has_audio, audio_size, has_ocr, ocr_size
+    FROM `zapy-306602.gtms.messages_by_lead`
+    WHERE key_type = 'email' AND lead_key = @email
+        AND (phone_key IS NULL OR phone_key != @phone)
+        AND created_at <= @settled_until
+
+    UNION ALL
+
+    -- Unsettled messages come with flags only: measuring their texts would
+    -- read them. Their sizes are NULL until the rollup stores them.
+    SELECT
+        message_uid, created_at, channel, message_text, file_url, message_direction,
+        attachment_filename,
+        audio_transcription IS NOT NULL as has_audio,
+        CAST(NULL AS INT64) as audio_size,
+        ocr_scan IS NOT NULL as has_ocr,
+        CAST(NULL AS INT64) as ocr_size
+    FROM recent_messages
+    WHERE phone_key = @phone OR email_key = @email
+)
+
 SELECT
+  message_uid,
   created_at,
   channel,
   message_text,
   file_url as attachment_url,
-  audio_transcription,
-  ocr_scan,
+  -- OCR and transcription texts are loaded separately (message_payloads.sql)
+  has_audio,
+  audio_size,
+  has_ocr,
+  ocr_size,
   message_direction,
   attachment_filename
-FROM `zapy-306602.gtms.messages`
+FROM lead_messages
 WHERE
-    (chat_phone = @phone OR account_email = @email)
-    AND (chat_phone IS NOT NULL OR account_email IS NOT NULL)
+    -- Keyset pagination: only messages older than the last one already loaded
+    (
+        created_at < @before_created_at
+        OR (created_at = @before_created_at AND message_uid < @before_uid)
+    )
     -- AND TRIM(message_text) != ''
     -- AND message_text IS NOT NULL
-    
-ORDER BY created_at DESC 
\ No newline at end of file
+
+ORDER BY created_at DESC, message_uid DESC
+LIMIT @page_size
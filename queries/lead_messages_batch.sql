@@ -0,0 +1,80 @@
+with
+
+-- Messages newer than @settled_until, the watermark of the rollup, read from
+-- gtms.messages itself with flags only, as in lead_messages.sql
+recent_messages as (
+    SELECT
+        *,
+        `zapy-306602.gtms.normalize_phone`(chat_phone) as phone_key,
+        `zapy-306602.gtms.normalize_email`(account_email) as email_key,
+        audio_transcription IS NOT NULL as has_audio,
+        CAST(NULL AS INT64) as audio_size,
+        ocr_scan IS NOT NULL as has_ocr,
+        CAST(NULL AS INT64) as ocr_size
+    FROM `zapy-306602.gtms.messages`
+    WHERE created_at > @settled_until
+),
+
+-- First page of each lead: its newest messages are among the newest of its
+-- phone key or the newest of its email key. A message found under both keys
+-- comes back twice, once per key.
+lead_messages as (
+    (
+        SELECT
+            key_type, lead_key, message_uid, created_at, channel, message_text, file_url,
+            message_direction, attachment_filename, has_audio, audio_size, has_ocr, ocr_size
+        FROM `zapy-306602.gtms.messages_by_lead`
+        WHERE key_type = 'phone' AND lead_key IN UNNEST(@phones)
+            AND created_at <= @settled_until
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY lead_key ORDER BY created_at DESC, message_uid DESC) <= @page_size
+    )
+
+    UNION ALL
+
+    (
+        SELECT
+            key_type, lead_key, message_uid, created_at, channel, message_text, file_url,
+            message_direction, attachment_filename, has_audio, audio_size, has_ocr, ocr_size
+        FROM `zapy-306602.gtms.messages_by_lead`
+        WHERE key_type = 'email' AND lead_key IN UNNEST(@emails)
+            AND created_at <= @settled_until
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY lead_key ORDER BY created_at DESC, message_uid DESC) <= @page_size
+    )
+
+    UNION ALL
+
+    SELECT
+        'phone', phone_key, message_uid, created_at, channel, message_text, file_url,
+        message_direction, attachment_filename, has_audio, audio_size, has_ocr, ocr_size
+    FROM recent_messages
+    WHERE phone_key IN UNNEST(@phones)
+
+    UNION ALL
+
+    SELECT
+        'email', email_key, message_uid, created_at, channel, message_text, file_url,
+        message_direction, attachment_filename, has_audio, audio_size, has_ocr, ocr_size
+    FROM recent_messages
+    WHERE email_key IN UNNEST(@emails)
+)
+
+SELECT
+  key_type,
+  lead_key,
+  message_uid,
+  created_at,
+  channel,
+  message_text,
+  file_url as attachment_url,
+  -- OCR and transcription texts are loaded separately (message_payloads.sql)
+  has_audio,
+  audio_size,
+  has_ocr,
+  ocr_size,
+  message_direction,
+  attachment_filename
+FROM lead_messages
+WHERE true
+-- The settled page of a key plus its recent messages can pass the page size
+QUALIFY ROW_NUMBER() OVER (PARTITION BY key_type, lead_key ORDER BY created_at DESC, message_uid DESC) <= @page_size
+ORDER BY created_at DESC, message_uid DESC
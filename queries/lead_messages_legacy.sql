@@ -0,0 +1,29 @@
+-- Lookup on the raw phone/email strings, kept to benchmark lead_messages.sql
+-- against (benchmarks/bench_contact_keys.py)
+SELECT
+  message_uid,
+  created_at,
+  channel,
+  message_text,
+  file_url as attachment_url,
+  -- OCR and transcription texts are loaded separately (message_payloads.sql)
+  audio_transcription IS NOT NULL as has_audio,
+  LENGTH(audio_transcription) as audio_size,
+  ocr_scan IS NOT NULL as has_ocr,
+  LENGTH(ocr_scan) as ocr_size,
+  message_direction,
+  attachment_filename
+FROM `zapy-306602.gtms.messages`
+WHERE
+    (chat_phone = @phone OR account_email = @email)
+    AND (chat_phone IS NOT NULL OR account_email IS NOT NULL)
+    -- AND TRIM(message_text) != ''
+    -- AND message_text IS NOT NULL
+    -- Keyset pagination: only messages older than the last one already loaded
+    AND (
+        created_at < @before_created_at
+        OR (created_at = @before_created_at AND message_uid < @before_uid)
+    )
+    
+ORDER BY created_at DESC, message_uid DESC
+LIMIT @page_size
@@ -0,0 +1,14 @@
+-- OCR and transcription texts of some of a lead's messages, read from
+-- gtms.messages by message_uid: the keyed copy in messages_by_lead does not
+-- store them. The created_at bounds of the lead's history limit the scan.
+SELECT
+  message_uid,
+  ocr_scan,
+  audio_transcription
+FROM `zapy-306602.gtms.messages`
+WHERE message_uid IN UNNEST(@message_uids)
+    AND created_at BETWEEN @created_from AND @created_until
+    AND (
+        `zapy-306602.gtms.normalize_phone`(chat_phone) = @phone
+        OR `zapy-306602.gtms.normalize_email`(account_email) = @email
+    )
@@ -0,0 +1,26 @@
+-- Next batch of messages for the local full-text index (message_search.py),
+-- in (created_at, message_uid) order after the given position. Keys are
+-- normalized as in contact_keys.py, to find the leads of each hit.
+SELECT
+  message_uid,
+  created_at,
+  `zapy-306602.gtms.normalize_phone`(chat_phone) as phone_key,
+  `zapy-306602.gtms.normalize_email`(account_email) as email_key,
+  message_text,
+  ocr_scan,
+  audio_transcription,
+  attachment_filename
+FROM `zapy-306602.gtms.messages`
+WHERE
+    (
+        created_at > @after_created_at
+        OR (created_at = @after_created_at AND message_uid > @after_uid)
+    )
+    AND (
+        message_text IS NOT NULL
+        OR ocr_scan IS NOT NULL
+        OR audio_transcription IS NOT NULL
+        OR attachment_filename IS NOT NULL
+    )
+ORDER BY created_at, message_uid
+LIMIT @batch_size
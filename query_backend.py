@@ -0,0 +1,156 @@
+"""Query backends for the SQL files in `queries/`.
+
+The app and the jobs only talk to a `QueryBackend`: BigQuery in production,
+or DuckDB over Parquet fixtures to run everything on a laptop or in CI.
+Pick one with environment variables:
+
+    ROSENBAUM_BACKEND=bigquery                 (default)
+    ROSENBAUM_BACKEND=duckdb
+    ROSENBAUM_FIXTURES_DIR=fixtures/           <dataset>/<table>.parquet files
+    ROSENBAUM_DUCKDB_PATH=local.duckdb         defaults to an in-memory database
+    ROSENBAUM_RESULT_CACHE=/shared/cache.db    results shared across processes,
+                                               see result_cache (BigQuery default:
+                                               .cache/results.sqlite, `off` disables)
+"""
+import os
+import sqlite3
+import threading
+
+import pyarrow as pa
+
+queries_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'queries')
+
+
+def read_sql_file(file_path):
+    with open(file_path, 'r') as file:
+        return file.read()
+
+
+def read_query(name):
+    """Read a query file from `queries/` by name."""
+    return read_sql_file(os.path.join(queries_dir, name))
+
+
+class QueryBackend:
+    """Runs BigQuery-dialect SQL with named parameters."""
+
+    name = None
+
+    def run_query(self, query, params=None, scope=None):
+        """Run a query and return its result as a DataFrame with compact dtypes.
+
+        `scope` names the data the result belongs to ('leads', a lead's
+        scope from message_cache.lead_scope, or a list of them), so that a
+        cached result can be invalidated along with its scope. Backends
+        without a cache ignore it.
+        """
+        raise NotImplementedError
+
+    def run_script(self, script, params=None):
+        """Run a multi-statement script (DDL/DML)."""
+        raise NotImplementedError
+
+    def invalidate(self, scope):
+        """Make cached results of `scope` stale, if this backend keeps any."""
+
+    def uncached(self):
+        """This backend without its result cache, for bulk reads not worth caching."""
+        return self
+
+
+class BigQueryBackend(QueryBackend):
+    name = 'bigquery'
+
+    def run_query(self, query, params=None, scope=None):
+        import bigquery
+        return bigquery.run_query(query, params)
+
+    def run_script(self, script, params=None):
+        import bigquery
+        bigquery.run_script(script, params)
+
+
+class DuckDBBackend(QueryBackend):
+    """Runs the query files on DuckDB, see local_sql for the dialect shims."""
+
+    name = 'duckdb'
+
+    def __init__(self, database=':memory:', fixtures_dir=None):
+        import local_sql
+        self._local_sql = local_sql
+        self._con = local_sql.connect(database, fixtures_dir)
+        self._lock = threading.Lock()
+
+    def _cursor(self):
+        # DuckDB connections are not shared across threads; each call gets
+        # its own cursor on the same database.
+        with self._lock:
+            return self._con.cursor()
+
+    def run_query(self, query, params=None, scope=None):
+        return self._local_sql.run_query(self._cursor(), query, params)
+
+    def run_script(self, script, params=None):
+        self._local_sql.run_script(self._cursor(), script, params)
+
+
+class CachedBackend(QueryBackend):
+    """Serves query results from a ResultCache shared with other processes.
+
+    A result is cached under the current versions of its scopes; invalidating
+    a scope bumps its version, for every process sharing the cache. Scripts
+    always go to the wrapped backend. If the cache file cannot be used,
+    queries fall back to the wrapped backend too.
+    """
+
+    def __init__(self, backend, cache):
+        self.name = backend.name
+        self._backend = backend
+        self._cache = cache
+
+    def run_query(self, query, params=None, scope=None):
+        from result_cache import result_key
+        try:
+            key = result_key(self.name, query, params, self._cache.versions(scope))
+            return self._cache.get_or_compute(key, lambda: self._backend.run_query(query, params))
+        except (sqlite3.Error, pa.ArrowException) as e:
+            print(f"Erro no cache de resultados: {str(e)}")
+            return self._backend.run_query(query, params)
+
+    def run_script(self, script, params=None):
+        self._backend.run_script(script, params)
+
+    def uncached(self):
+        return self._backend
+
+    def invalidate(self, scope):
+        try:
+            self._cache.bump(scope)
+        except sqlite3.Error as e:
+            print(f"Erro no cache de resultados: {str(e)}")
+
+
+def _with_result_cache(backend, default_path=None):
+    path = os.environ.get('ROSENBAUM_RESULT_CACHE', default_path)
+    if not path or path == 'off':
+        return backend
+    from result_cache import ResultCache
+    return CachedBackend(backend, ResultCache(path))
+
+
+def backend_from_env():
+    """Create the backend selected by the ROSENBAUM_* environment variables."""
+    kind = os.environ.get('ROSENBAUM_BACKEND', 'bigquery')
+    if kind == 'bigquery':
+        default_path = os.path.join(os.path.dirname(queries_dir), '.cache', 'results.sqlite')
+        return _with_result_cache(BigQueryBackend(), default_path)
+    if kind == 'duckdb':
+        from lead_stats_job import update_lead_message_stats
+        backend = DuckDBBackend(
+            os.environ.get('ROSENBAUM_DUCKDB_PATH', ':memory:'),
+            os.environ.get('ROSENBAUM_FIXTURES_DIR'),
+        )
+        # The lead list reads the rollup, so build it from the fixtures
+        update_lead_message_stats(backend)
+        return _with_result_cache(backend)
+    raise ValueError(f"Backend desconhecido: {kind}")
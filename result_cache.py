@@ -0,0 +1,170 @@
+"""Query results shared by every process that opens the same cache file.
+
+Results are stored as Arrow IPC blobs in a SQLite database, keyed by a hash
+of the query and its parameters. All the Streamlit workers and replicas
+pointed at one file (on a shared disk) then pay for a given BigQuery job
+once per TTL instead of once each.
+
+SQLite serializes writers; on top of that, a lease row makes sure only one
+process computes a missing result while the others wait for it.
+
+Invalidation is by scope: keys include the version of the scopes a result
+belongs to, and bumping a version makes those results unreachable (they
+then age out like any other entry).
+"""
+import hashlib
+import json
+import sqlite3
+import time
+
+import pyarrow as pa
+
+from arrow_frames import table_to_frame
+from sqlite_store import SQLiteStore, evict
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    scope TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+
+def result_key(*parts):
+    """Hash of a query, its parameters and anything else the result depends on."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _serialize(frame):
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _deserialize(data):
+    table = pa.ipc.open_stream(pa.py_buffer(data)).read_all()
+    return table_to_frame(table.replace_schema_metadata(None))
+
+
+class ResultCache(SQLiteStore):
+    """DataFrames cached in a SQLite file, with a TTL and a size bound.
+
+    Entries older than `ttl` seconds are ignored and eventually replaced;
+    once the file holds more than `max_bytes` of results, the least recently
+    read ones are evicted.
+    """
+
+    def __init__(self, path, ttl=300, max_bytes=512 * 1024 * 1024, lease=120.0):
+        super().__init__(path, _SCHEMA)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lease = lease
+
+    def get(self, key):
+        """Return the cached DataFrame for `key`, or None if missing or expired."""
+        now = time.time()
+        with self._connect() as con:
+            row = con.execute(
+                'SELECT data FROM results WHERE key = ? AND created_at > ?',
+                (key, now - self.ttl),
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            with self._write() as con:
+                con.execute('UPDATE results SET accessed_at = ? WHERE key = ?', (now, key))
+        except sqlite3.OperationalError:
+            pass  # the read still counts; only the LRU order goes stale
+        return _deserialize(row[0])
+
+    def put(self, key, frame):
+        data = _serialize(frame)
+        now = time.time()
+        with self._write() as con:
+            con.execute(
+                'INSERT OR REPLACE INTO results (key, created_at, accessed_at, size, data) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, now, now, len(data), data),
+            )
+            evict(con, 'results', now, self.ttl, self.max_bytes)
+
+    def versions(self, scope):
+        """Current versions of a scope or list of scopes, for result keys."""
+        if scope is None:
+            return None
+        scopes = [scope] if isinstance(scope, str) else sorted(set(scope))
+        if not scopes:
+            return []
+        placeholders = ', '.join('?' * len(scopes))
+        with self._connect() as con:
+            found = dict(con.execute(
+                f'SELECT scope, version FROM versions WHERE scope IN ({placeholders})', scopes
+            ).fetchall())
+        return [[name, found.get(name, 0)] for name in scopes]
+
+    def bump(self, scope):
+        """Invalidate the cached results of `scope` in every process."""
+        with self._write() as con:
+            con.execute(
+                'INSERT INTO versions (scope, version) VALUES (?, 1) '
+                'ON CONFLICT (scope) DO UPDATE SET version = version + 1',
+                (scope,),
+            )
+
+    def _acquire(self, key):
+        """Take the lease on computing `key`; False if another process holds it."""
+        now = time.time()
+        with self._write() as con:
+            con.execute('DELETE FROM leases WHERE key = ? AND expires_at <= ?', (key, now))
+            taken = con.execute(
+                'INSERT OR IGNORE INTO leases (key, expires_at) VALUES (?, ?)',
+                (key, now + self.lease),
+            ).rowcount
+        return taken == 1
+
+    def _release(self, key):
+        with self._write() as con:
+            con.execute('DELETE FROM leases WHERE key = ?', (key,))
+
+    def get_or_compute(self, key, compute, wait=60.0, poll=0.2):
+        """Return the cached result for `key`, computing it with `compute()` if needed.
+
+        If another process is already computing it, wait up to `wait` seconds
+        for its result before computing it here as well.
+        """
+        frame = self.get(key)
+        if frame is not None:
+            return frame
+        deadline = time.monotonic() + wait
+        while True:
+            if self._acquire(key):
+                try:
+                    frame = compute()
+                    self.put(key, frame)
+                    return frame
+                finally:
+                    self._release(key)
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(poll)
+            frame = self.get(key)
+            if frame is not None:
+                return frame
+        # The lease holder is too slow: compute without it
+        frame = compute()
+        self.put(key, frame)
+        return frame
@@ -0,0 +1,75 @@
+import json
+import os
+from datetime import datetime, timezone
+
+import pyarrow as pa
+
+from arrow_frames import table_to_frame
+
+# Bump when the layout of the snapshot changes; older files are then ignored.
+SNAPSHOT_FORMAT_VERSION = 1
+_METADATA_KEY = b'rosenbaum.snapshot'
+
+
+def write_snapshot(path, frame, **header):
+    """Write a DataFrame as an uncompressed Arrow IPC file with a header.
+
+    The header (plus the format version and write time) is stored in the schema
+    metadata. The file is written next to `path` and renamed over it, so readers
+    never see a partial snapshot.
+    """
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    header = dict(header, format_version=SNAPSHOT_FORMAT_VERSION,
+                  written_at=datetime.now(timezone.utc).isoformat())
+    metadata = dict(table.schema.metadata or {})
+    metadata[_METADATA_KEY] = json.dumps(header, default=str).encode('utf-8')
+    table = table.replace_schema_metadata(metadata)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path):
+    """Read a snapshot written by write_snapshot.
+
+    Returns `(frame, header)`, or `(None, None)` when there is no usable
+    snapshot. The file is memory-mapped and the frame built with
+    arrow_frames.table_to_frame: the large text columns stay Arrow-backed
+    on the mapped buffers, while the other columns are converted to pandas
+    here (strings to Python objects, labels to categoricals).
+    """
+    if not os.path.exists(path):
+        return None, None
+    try:
+        source = pa.memory_map(path, 'r')
+        table = pa.ipc.open_file(source).read_all()
+        header = json.loads((table.schema.metadata or {}).get(_METADATA_KEY, b'{}'))
+        if header.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+            return None, None
+        return table_to_frame(table.replace_schema_metadata(None)), header
+    except (OSError, pa.ArrowException, ValueError) as e:
+        print(f"Erro ao ler snapshot {path}: {str(e)}")
+        return None, None
+
+
+def snapshot_rows(path):
+    """Number of rows of a snapshot, read from its batch headers, or None.
+
+    Cheap enough for decisions made before the first render: the file is
+    memory-mapped and no column is converted.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        reader = pa.ipc.open_file(pa.memory_map(path, 'r'))
+        header = json.loads((reader.schema.metadata or {}).get(_METADATA_KEY, b'{}'))
+        if header.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+            return None
+        return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+    except (OSError, pa.ArrowException, ValueError) as e:
+        print(f"Erro ao ler snapshot {path}: {str(e)}")
+        return None
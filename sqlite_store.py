@@ -0,0 +1,54 @@
+"""SQLite files shared by every process of the app.
+
+The result cache, the Grok answer cache and the message search index are
+each one SQLite file that several Streamlit workers and replicas open at
+once. They connect, write and evict the same way, defined here.
+"""
+import os
+import sqlite3
+from contextlib import closing, contextmanager
+
+
+class SQLiteStore:
+    """A SQLite file at `path`, created with `schema` if needed."""
+
+    def __init__(self, path, schema):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as con:
+            con.executescript(schema)
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per operation: safe across threads, and
+        # the busy timeout makes concurrent writers queue instead of failing.
+        with closing(sqlite3.connect(self.path, timeout=30.0, isolation_level=None)) as con:
+            yield con
+
+    @contextmanager
+    def _write(self):
+        with self._connect() as con:
+            con.execute('BEGIN IMMEDIATE')
+            try:
+                yield con
+                con.execute('COMMIT')
+            except BaseException:
+                con.execute('ROLLBACK')
+                raise
+
+
+def evict(con, table, now, ttl, max_bytes):
+    """Delete the rows of `table` older than `ttl`, then the least recently
+    read ones until their sizes add up to at most `max_bytes`.
+
+    `table` has `key`, `created_at`, `accessed_at` and `size` columns.
+    """
+    con.execute(f'DELETE FROM {table} WHERE created_at <= ?', (now - ttl,))
+    total = con.execute(f'SELECT COALESCE(SUM(size), 0) FROM {table}').fetchone()[0]
+    if total <= max_bytes:
+        return
+    for key, size in con.execute(f'SELECT key, size FROM {table} ORDER BY accessed_at').fetchall():
+        con.execute(f'DELETE FROM {table} WHERE key = ?', (key,))
+        total -= size
+        if total <= max_bytes:
+            break
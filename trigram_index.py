@@ -0,0 +1,87 @@
+"""Accent-insensitive substring search over a column of short texts.
+
+Texts are folded (accents stripped, case-folded) and indexed by their
+character trigrams. A query's trigrams select candidate rows through the
+posting lists, and only those candidates are checked for the substring.
+"""
+import re
+import unicodedata
+
+import numpy as np
+
+# Combining marks left over by NFKD decomposition (the accents)
+_COMBINING = re.compile('[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]')
+
+
+def fold(text):
+    """Lower-case `text` and strip its accents: "João" -> "joao"."""
+    return _COMBINING.sub('', unicodedata.normalize('NFKD', text)).casefold()
+
+
+def _code_points(text):
+    return np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+
+
+def _trigram_codes(points):
+    """One uint64 per trigram: the three 21-bit code points side by side."""
+    return (points[:-2] << np.uint64(42)) | (points[1:-1] << np.uint64(21)) | points[2:]
+
+
+class TrigramIndex:
+    """Trigram posting lists over the folded texts of a Series, by position.
+
+    Trigrams are computed with NumPy over all the texts at once, joined by
+    NUL separators, so building stays fast for 100k+ rows.
+    """
+
+    def __init__(self, texts):
+        # Folded in one pass over all the texts, NUL-separated
+        joined = fold('\0'.join(text.replace('\0', ' ') if isinstance(text, str) else '' for text in texts))
+        self._texts = joined.split('\0')
+        points = _code_points(joined + '\0')
+        lengths = np.fromiter((len(text) + 1 for text in self._texts), dtype=np.int64,
+                              count=len(self._texts))
+        owners = np.repeat(np.arange(len(self._texts), dtype=np.int32), lengths)
+
+        # Trigrams crossing a separator belong to no text
+        codes = _trigram_codes(points)
+        within = (points[:-2] != 0) & (points[1:-1] != 0) & (points[2:] != 0)
+        codes, positions = codes[within], owners[:-2][within]
+
+        # Sort by (trigram, position), drop repeats inside a text, then split
+        order = np.lexsort((positions, codes))
+        codes, positions = codes[order], positions[order]
+        distinct = np.ones(len(codes), dtype=bool)
+        distinct[1:] = (codes[1:] != codes[:-1]) | (positions[1:] != positions[:-1])
+        codes, positions = codes[distinct], positions[distinct]
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        self._postings = dict(zip(codes[starts].tolist(), np.split(positions, starts[1:])))
+
+    def _candidates(self, query):
+        if len(query) < 3:
+            return range(len(self._texts))
+        lists = []
+        for code in set(_trigram_codes(_code_points(query)).tolist()):
+            positions = self._postings.get(code)
+            if positions is None:
+                return []
+            lists.append(positions)
+        lists.sort(key=len)
+        candidates = lists[0]
+        for positions in lists[1:]:
+            candidates = np.intersect1d(candidates, positions, assume_unique=True)
+            if len(candidates) == 0:
+                break
+        return candidates
+
+    def search(self, query):
+        """Positions whose text contains `query`, ignoring case and accents.
+
+        The query is a plain substring, not a pattern.
+        """
+        query = fold(query)
+        texts = self._texts
+        return np.array(
+            [position for position in self._candidates(query) if query in texts[position]],
+            dtype=np.intp,
+        )